@@ -0,0 +1,168 @@
+"""adaptive.py
+
+Adaptive quiz difficulty from per-student performance statistics.
+
+Each student's (or user's) statistics are one fixed-size float array:
+exponentially decayed sums of correct answers, response times and
+answer counts for every operator and operand-size band. It is cached in
+memcache as raw bytes and persisted in an AdaptiveStats child entity
+written with each graded quiz, so picking the next quiz normally costs
+a single memcache get.
+
+The next quiz uses the hardest band the student has mastered for every
+operator, and gives weak or slow operators more weight in the operator
+mix so they come up more often.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+from array import array
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import AdaptiveStats
+import quizgen
+
+# Operand-size bands, easiest first; each is a quizgen difficulty
+LEVELS = ('EASY', 'MEDIUM', 'HARD')
+
+DECAY = 0.9
+PROMOTE_ACCURACY = 0.8
+MIN_ANSWERS = 5.0
+SLOW_MILLIS = 10000
+MAX_WEIGHT = 5
+
+STATS_ID = 'adaptive'
+MEMCACHE_STATS_KEY = "ADAPTIVE_STATS:%s"
+STATS_CACHE_TIME = 3600
+
+_CELLS = len(quizgen.OPERATORS) * len(LEVELS)
+
+# Offsets of the three sections of a stats array
+_CORRECT = 0
+_MILLIS = _CELLS
+_ANSWERS = 2 * _CELLS
+
+
+def newStats():
+    """Return an empty stats array.
+    """
+
+    return array('f', [0.0] * (3 * _CELLS))
+
+
+def _cell(operatorIndex, level):
+    return operatorIndex * len(LEVELS) + level
+
+
+def _level(quiz):
+    """Return the LEVELS index of a generated quiz's operand band.
+    """
+
+    for level, difficulty in enumerate(LEVELS):
+        if quiz.maxValue <= quizgen.DIFFICULTIES[difficulty][1]:
+            return level
+    return len(LEVELS) - 1
+
+
+def statsKey(owner_key):
+    """Return the AdaptiveStats key for a Student or Profile key.
+    """
+
+    return ndb.Key(AdaptiveStats, STATS_ID, parent=owner_key)
+
+
+def _fromBytes(data):
+    stats = array('f')
+    stats.fromstring(data)
+    return stats
+
+
+def getStats(owner_key):
+    """Return the stats array for a Student or Profile key, from memcache
+    or else the datastore.
+    """
+
+    cache_key = MEMCACHE_STATS_KEY % owner_key.urlsafe()
+    data = memcache.get(cache_key)
+    if data is None:
+        entity = statsKey(owner_key).get()
+        data = entity.data if entity else newStats().tostring()
+
+        # Never replaces what recordQuiz cached on commit
+        memcache.add(cache_key, data, time=STATS_CACHE_TIME)
+    return _fromBytes(data)
+
+
+def foldQuiz(stats, quiz, marks, elapsedMillis):
+    """Decay a stats array and add a graded quiz's answers to it, in
+    place.
+    """
+
+    level = _level(quiz)
+    for i, (o, mark) in enumerate(zip(quiz.operatorIndexes, marks)):
+        cell = _cell(o, level)
+        millis = elapsedMillis[i] if i < len(elapsedMillis) else 0
+        stats[_CORRECT + cell] = stats[_CORRECT + cell] * DECAY + mark
+        stats[_MILLIS + cell] = stats[_MILLIS + cell] * DECAY + millis
+        stats[_ANSWERS + cell] = stats[_ANSWERS + cell] * DECAY + 1
+
+
+def recordQuiz(owner_key, quiz, marks, elapsedMillis):
+    """Fold a graded quiz into the owner's stats. Must be called in the
+    transaction storing the result; returns the AdaptiveStats entity to
+    put with it. The cached copy is refreshed on commit.
+    """
+
+    entity = statsKey(owner_key).get() \
+        or AdaptiveStats(key=statsKey(owner_key))
+    stats = _fromBytes(entity.data) if entity.data else newStats()
+    foldQuiz(stats, quiz, marks, elapsedMillis)
+
+    entity.data = stats.tostring()
+    data = entity.data
+    ndb.get_context().call_on_commit(lambda: memcache.set(
+        MEMCACHE_STATS_KEY % owner_key.urlsafe(), data,
+        time=STATS_CACHE_TIME))
+    return entity
+
+
+def _estimates(stats, cell):
+    """Return (accuracy, millis, answers) estimates for one cell.
+    """
+
+    answers = stats[_ANSWERS + cell]
+    if not answers:
+        return 0.0, 0.0, 0.0
+    return (stats[_CORRECT + cell] / answers,
+        stats[_MILLIS + cell] / answers, answers)
+
+
+def nextQuizParameters(stats):
+    """Return (difficulty, operators, weights) for the next quiz, with
+    more weight on weak or slow operators.
+    """
+
+    # An operator's level is the number of bands in a row mastered
+    levels = []
+    for o in range(len(quizgen.OPERATORS)):
+        level = 0
+        while level < len(LEVELS) - 1:
+            accuracy, millis, answers = _estimates(stats, _cell(o, level))
+            if answers < MIN_ANSWERS or accuracy < PROMOTE_ACCURACY:
+                break
+            level += 1
+        levels.append(level)
+
+    # Use the band every operator is ready for
+    level = min(levels)
+    weights = []
+    for o in range(len(quizgen.OPERATORS)):
+        accuracy, millis, answers = _estimates(stats, _cell(o, level))
+        weight = 1 + int(round((MAX_WEIGHT - 2) * (1 - accuracy)))
+        if millis > SLOW_MILLIS:
+            weight += 1
+        weights.append(weight)
+    return LEVELS[level], list(quizgen.OPERATORS), weights
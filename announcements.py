@@ -0,0 +1,103 @@
+"""announcements.py
+
+Nearly sold out conference announcements.
+
+The set of nearly sold out conferences is kept in memcache under a
+versioned key as {websafeConferenceKey: name}, and updated from the
+registration path whenever a conference's seat count crosses the
+threshold. Reads serve the cached set; once it is older than
+REVALIDATE_TIME a task rebuilds it from the datastore while the stale
+set keeps being served.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+NEARLY_SOLD_OUT = 5
+ANNOUNCEMENTS_VERSION = 1
+MEMCACHE_ANNOUNCEMENTS_KEY = "NEARLY_SOLD_OUT:v%d" % ANNOUNCEMENTS_VERSION
+REVALIDATE_TIME = 3600
+REFRESH_URL = '/tasks/refresh_announcement'
+CAS_RETRIES = 5
+
+
+def _format(confs):
+    """Return the announcement text for {websafeConferenceKey: name}.
+    """
+
+    if not confs:
+        return ''
+    return 'Last chance to attend! The following conferences are ' \
+        'nearly sold out: %s' % ', '.join(sorted(confs.values()))
+
+
+def refresh():
+    """Rebuild the nearly sold out set from the datastore and cache it.
+    Returns the announcement text.
+    """
+
+    seats = ndb.GenericProperty('seatsAvailable')
+    confs = ndb.Query(kind='Conference', filters=ndb.AND(
+        seats <= NEARLY_SOLD_OUT, seats > 0)).fetch(projection=['name'])
+    data = {
+        'confs': dict((conf.key.urlsafe(), conf.name) for conf in confs),
+        'refreshed': time.time(),
+        }
+    memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, data)
+    return _format(data['confs'])
+
+
+def seatsChanged(c_key, name, seats):
+    """Add or remove a conference from the cached set when its seat
+    count crosses the threshold.
+    """
+
+    wsck = c_key.urlsafe()
+    nearlySoldOut = 0 < seats <= NEARLY_SOLD_OUT
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        data = client.gets(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+        # Nothing cached; the next read rebuilds the set
+        if data is None:
+            return
+        confs = data['confs']
+        if nearlySoldOut == (confs.get(wsck) == name):
+            return
+        if nearlySoldOut:
+            confs[wsck] = name
+        else:
+            confs.pop(wsck, None)
+        if client.cas(MEMCACHE_ANNOUNCEMENTS_KEY, data):
+            return
+
+    # Too much contention; let the next read rebuild the set
+    memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+
+def getAnnouncement():
+    """Return the announcement text, revalidating a stale set in the
+    background.
+    """
+
+    data = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+    if data is None:
+        return refresh()
+
+    if data['refreshed'] + REVALIDATE_TIME < time.time():
+        # Named per interval so only one rebuild is queued
+        try:
+            taskqueue.add(
+                name='announcement-%d' % (
+                    int(time.time()) // REVALIDATE_TIME),
+                url=REFRESH_URL)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+    return _format(data['confs'])
@@ -0,0 +1,160 @@
+"""answerlog.py
+
+Write-behind buffer for per-answer events.
+
+Each answer given during a quiz is queued as a task on the
+answer-events pull queue, which is the only write on the answer path.
+The first event in each window schedules one named flush task; the
+flush worker leases the buffered events and merges them into one
+AnswerAttempt per student and attempt, writing each class's attempts in
+one transaction. Attempts are keyed by a hash of the client's attempt
+id and the quiz's parameters, so retakes and changed parameters are
+stored apart. Events are keyed by their event id within an attempt and
+only deleted from the queue once written, so delivery is at least once
+and a redelivered or resubmitted event is stored once; an event that
+cannot be read is logged and deleted.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import hashlib
+import json
+import logging
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+import namedtasks
+import quizgen
+from models import AnswerAttempt
+
+EVENTS_QUEUE = 'answer-events'
+FLUSH_WINDOW = 30
+FLUSH_URL = '/tasks/flush_answer_events'
+LEASE_SECONDS = 300
+MAX_TASKS = 1000
+MAX_GROUP_PUT = 500
+
+# Errors raised reading an event that can never be written
+UNREADABLE = (ValueError, TypeError, KeyError, ProtocolBufferDecodeError)
+
+
+def attemptKey(owner_key, quiz, attemptId=None):
+    """Return the AnswerAttempt key for a client attempt id and a
+    generated quiz under a Student or Profile key.
+    """
+
+    digest = hashlib.sha1(json.dumps([attemptId, quiz.seed,
+        quiz.difficulty, quiz.minValue, quiz.maxValue, quiz.operators,
+        quiz.weights, len(quiz.answers)]).encode('utf-8')).hexdigest()
+    return ndb.Key(AnswerAttempt, digest, parent=owner_key)
+
+
+def enqueueAnswer(owner_key, user_id, quiz, attemptId, eventId, index,
+        answer, correct, elapsedMillis=None):
+    """Buffer one answer event for the next flush.
+    """
+
+    taskqueue.Queue(EVENTS_QUEUE).add(taskqueue.Task(
+        payload=json.dumps({
+            'attempt': attemptKey(owner_key, quiz, attemptId).urlsafe(),
+            'user_id': user_id,
+            'seed': quiz.seed,
+            'attemptId': attemptId,
+            'id': eventId,
+            'event': [index, answer, bool(correct), elapsedMillis,
+                int(time.time())],
+            }),
+        method='PULL'))
+    namedtasks.scheduleFlush('answers', FLUSH_URL, FLUSH_WINDOW)
+
+
+@ndb.transactional()
+def _mergeGroup(eventsByKey):
+    """Merge {AnswerAttempt key: [event payloads]} for keys of one
+    entity group into their attempts.
+    """
+
+    keys = list(eventsByKey)
+    attempts = ndb.get_multi(keys)
+    for i, key in enumerate(keys):
+        attempt = attempts[i] or AnswerAttempt(
+            key=key, events={}, correct=0, answered=0)
+        for event in eventsByKey[key]:
+            attempt.user_id = event.get('user_id')
+            attempt.seed = event['seed']
+            attempt.attemptId = event.get('attemptId')
+            attempt.events[event['id']] = event['event']
+        attempt.answered = len(attempt.events)
+        attempt.correct = sum(1 for e in attempt.events.values() if e[2])
+        attempts[i] = attempt
+    ndb.put_multi(attempts)
+
+
+def _read(task):
+    """Return (AnswerAttempt key, payload) for a leased event task.
+    Raises one of UNREADABLE if it cannot be written.
+    """
+
+    payload = json.loads(task.payload)
+    key = ndb.Key(urlsafe=payload['attempt'])
+    if key.kind() != AnswerAttempt._get_kind() or not key.parent():
+        raise ValueError('Not an answer attempt key: %s' % key)
+    if not 1 <= payload['seed'] <= quizgen.MAX_SEED \
+            or not payload['id'] or len(payload['event']) != 5:
+        raise ValueError('Invalid answer event.')
+    return key, payload
+
+
+def _merge(events):
+    """Write (AnswerAttempt key, payload) events into their attempts, one
+    transaction per class (entity group).
+    """
+
+    groups = {}
+    for key, payload in events:
+        root = key.root()
+        groups.setdefault(root, {}).setdefault(key, []).append(payload)
+
+    for eventsByKey in groups.values():
+        keys = list(eventsByKey)
+        for i in range(0, len(keys), MAX_GROUP_PUT):
+            _mergeGroup(dict(
+                (key, eventsByKey[key]) for key in keys[i:i + MAX_GROUP_PUT]))
+
+
+def flush():
+    """Lease the buffered answer events and write them in batches.
+    Returns the number of events written.
+    """
+
+    queue = taskqueue.Queue(EVENTS_QUEUE)
+    written = 0
+    while True:
+        tasks = queue.lease_tasks(LEASE_SECONDS, MAX_TASKS)
+        if not tasks:
+            break
+
+        # Drop events that can never be written rather than the batch
+        events = []
+        for task in tasks:
+            try:
+                events.append(_read(task))
+            except UNREADABLE:
+                logging.exception('Deleting unreadable answer event %s: %r',
+                    task.name, task.payload)
+        try:
+            _merge(events)
+        except Exception:
+            # Leave the events to be leased again after LEASE_SECONDS
+            logging.exception('Could not write %d answer events',
+                len(tasks))
+            namedtasks.scheduleFlush('answers-retry', FLUSH_URL,
+                FLUSH_WINDOW, LEASE_SECONDS)
+            break
+        queue.delete_tasks(tasks)
+        written += len(events)
+    return written
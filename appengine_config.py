@@ -1,4 +0,0 @@
-def webapp_add_wsgi_middleware(app):
-	from google.appengine.ext.appstats import recording
-	app = recording.appstats_wsgi_middleware(app)
-	return app
\ No newline at end of file
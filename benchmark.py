@@ -0,0 +1,212 @@
+"""benchmark.py
+
+Local endpoint benchmarks.
+
+Drives the real QuizerApi endpoint methods against the in-memory
+services from localstubs, with data sets of a given size, and reports
+throughput and p50/p99 latency for each scenario. The quizgen
+scenarios need no SDK.
+
+    python benchmark.py [--sdk PATH] [--size N] [--iterations N]
+        [--consistency P] [scenario ...]
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import argparse
+import collections
+import time
+
+import localstubs
+
+CITIES = ('London', 'Paris', 'Berlin', 'Tokyo', 'Chicago')
+TOPICS = ('Math', 'Science', 'Reading', 'History')
+
+SCENARIOS = collections.OrderedDict()
+
+
+def scenario(name, stubs=True):
+    """Register a scenario. Its function takes the data size, sets up
+    any data and returns the operation to time, called with the
+    iteration number.
+    """
+
+    def register(setup):
+        SCENARIOS[name] = (setup, stubs)
+        return setup
+    return register
+
+
+def _api():
+    from quizer import QuizerApi
+    return QuizerApi()
+
+
+def _createConferences(api, size):
+    """Create size conferences spread over CITIES, TOPICS and months.
+    Returns their websafe keys.
+    """
+
+    from models import ConferenceForm
+
+    wscks = []
+    for i in range(size):
+        localstubs.newRequest('setup-%d' % i)
+        form = api.createConference(ConferenceForm(
+            name='Conference %d' % i,
+            city=CITIES[i % len(CITIES)],
+            topics=[TOPICS[i % len(TOPICS)]],
+            startDate='2026-%02d-01' % (i % 12 + 1),
+            maxAttendees=1000000))
+        wscks.append(form.websafeKey)
+    return wscks
+
+
+@scenario('generate', stubs=False)
+def _generate(size):
+    import quizgen
+
+    count = min(size, quizgen.MAX_COUNT)
+    return lambda i: quizgen.generateQuiz(count=count, seed=i + 1)
+
+
+@scenario('grade', stubs=False)
+def _grade(size):
+    import quizgen
+
+    quiz = quizgen.generateQuiz(count=min(size, quizgen.MAX_COUNT), seed=1)
+    answers = list(quiz.answers)
+    return lambda i: quizgen.gradeQuiz(quiz, answers)
+
+
+@scenario('generateQuiz')
+def _generateQuiz(size):
+    import quizgen
+    from models import QuizRequestForm
+
+    api = _api()
+    count = min(size, quizgen.MAX_COUNT)
+    return lambda i: api.generateQuiz(QuizRequestForm(count=count, seed=i + 1))
+
+
+@scenario('submitAnswers')
+def _submitAnswers(size):
+    import quizgen
+    from models import AnswersForm
+    from models import QuizRequestForm
+
+    api = _api()
+    quiz = api.generateQuiz(QuizRequestForm(
+        count=min(size, quizgen.MAX_COUNT), seed=1))
+    answers = list(quizgen.solve(
+        [item.integer1 for item in quiz.items],
+        [item.integer2 for item in quiz.items],
+        [quizgen.OPERATORS.index(item.operator) for item in quiz.items]))
+    return lambda i: api.submitAnswers(
+        AnswersForm(quiz=quiz.quiz, answers=answers))
+
+
+@scenario('queryConferences')
+def _queryConferences(size):
+    from models import QueryForm
+    from models import QueryForms
+
+    api = _api()
+    _createConferences(api, size)
+    return lambda i: api.queryConferences(QueryForms(filters=[QueryForm(
+        field='CITY', operator='EQ', value=CITIES[i % len(CITIES)])]))
+
+
+@scenario('queryConferencesInequality')
+def _queryConferencesInequality(size):
+    from models import QueryForm
+    from models import QueryForms
+
+    api = _api()
+    _createConferences(api, size)
+    return lambda i: api.queryConferences(QueryForms(filters=[QueryForm(
+        field='MONTH', operator='GT', value=str(i % 12))]))
+
+
+@scenario('registerForConference')
+def _registerForConference(size):
+    import quizer
+
+    api = _api()
+    wsck = _createConferences(api, 1)[0]
+    request = quizer.CONF_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=wsck)
+
+    # Each registration is by a new user, through _conferenceRegistration
+    def register(i):
+        localstubs.signIn('user%d@example.com' % i)
+        return api.registerForConference(request)
+    return register
+
+
+def percentile(timings, p):
+    """Return the p-th percentile of sorted timings (nearest rank).
+    """
+
+    return timings[max(0, -(-len(timings) * p // 100) - 1)]
+
+
+def run(name, size, iterations, consistency):
+    """Run one scenario; returns (throughput per second, p50, p99) with
+    latencies in milliseconds.
+    """
+
+    setup, stubs = SCENARIOS[name]
+    bed = localstubs.activate(consistency) if stubs else None
+    try:
+        op = setup(size)
+        timings = []
+        for i in range(iterations):
+            if stubs:
+                localstubs.newRequest(i)
+            start = time.time()
+            op(i)
+            timings.append(time.time() - start)
+    finally:
+        if bed:
+            bed.deactivate()
+
+    timings.sort()
+    return (len(timings) / (sum(timings) or 1e-9),
+        1000 * percentile(timings, 50),
+        1000 * percentile(timings, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+        help='any of: %s (default all)' % ', '.join(SCENARIOS))
+    parser.add_argument('--sdk', help='App Engine SDK directory')
+    parser.add_argument('--size', type=int, default=100,
+        help='data set size (conferences, problems per quiz)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--consistency', type=float, default=1.0,
+        help='datastore write apply probability')
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(unknown))
+    if any(SCENARIOS[name][1] for name in names):
+        try:
+            localstubs.setupSdkPath(args.sdk)
+        except ImportError as e:
+            parser.error(str(e))
+
+    # A scenario that cannot be set up fails the whole run
+    print('%-28s %10s %10s %10s' % ('scenario', 'ops/s', 'p50 ms', 'p99 ms'))
+    for name in names:
+        throughput, p50, p99 = run(
+            name, args.size, args.iterations, args.consistency)
+        print('%-28s %10.1f %10.2f %10.2f' % (name, throughput, p50, p99))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""bundles.py
+
+Signed offline quiz bundles.
+
+A bundle carries a whole quiz for the client to run locally: the
+problems as parallel columns, a salted hash of each answer so the
+client can mark answers as they are given, and a token binding the
+quiz parameters to its owner, a nonce and an expiry, signed with an
+app secret. The client posts every answer back with the token in one
+call; the server verifies the token, regrades the quiz from its seed
+and stores the result keyed by the nonce, so a resubmitted bundle is
+recorded once.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from models import Secret
+
+BUNDLE_TTL = 7 * 24 * 3600
+HASH_LENGTH = 8
+SECRET_ID = 'bundle'
+
+_secret = []
+
+
+class InvalidBundleError(ValueError):
+    """The bundle token is malformed, forged or expired."""
+
+
+def _getSecret():
+    """Return the bundle signing secret, creating it on first use.
+    """
+
+    if not _secret:
+        entity = Secret.get_or_insert(SECRET_ID, secret=os.urandom(32))
+        _secret.append(entity.secret)
+    return _secret[0]
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    data = str(data)
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _sign(payload):
+    return hmac.new(_getSecret(), payload, hashlib.sha256).digest()
+
+
+def answerHash(nonce, index, answer):
+    """Return the hash the client compares an answer with: the first
+    HASH_LENGTH hex digits of sha256 of 'nonce:index:answer'.
+    """
+
+    data = '%s:%d:%d' % (nonce, index, answer)
+    return hashlib.sha256(data.encode('ascii')).hexdigest()[:HASH_LENGTH]
+
+
+def makeBundle(quiz, owner):
+    """Return (token, nonce, expires, answerHashes) for a generated quiz
+    and the websafe key of the Student or Profile it is recorded under.
+    """
+
+    nonce = _b64encode(os.urandom(12))
+    expires = int(time.time()) + BUNDLE_TTL
+    payload = json.dumps({
+        'q': [quiz.seed, quiz.difficulty, quiz.minValue, quiz.maxValue,
+            ''.join(quiz.operators), len(quiz.answers), quiz.weights],
+        'o': owner,
+        'n': nonce,
+        'e': expires,
+        }, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    token = '%s.%s' % (_b64encode(payload), _b64encode(_sign(payload)))
+    hashes = [answerHash(nonce, i, answer) \
+        for i, answer in enumerate(quiz.answers)]
+    return token, nonce, expires, hashes
+
+
+def readBundle(token):
+    """Verify a bundle token and return its fields as a dict with keys
+    seed, difficulty, minValue, maxValue, operators, count, weights,
+    owner and nonce. Raises InvalidBundleError.
+    """
+
+    try:
+        payload, signature = [_b64decode(part) \
+            for part in token.split('.')]
+    except (AttributeError, ValueError, TypeError, binascii.Error):
+        raise InvalidBundleError('Malformed bundle token.')
+    if not hmac.compare_digest(_sign(payload), signature):
+        raise InvalidBundleError('Bundle signature does not match.')
+
+    data = json.loads(payload.decode('utf-8'))
+    if data['e'] < time.time():
+        raise InvalidBundleError('Bundle has expired.')
+    seed, difficulty, minValue, maxValue, operators, count, weights = \
+        data['q']
+    return {
+        'seed': seed,
+        'difficulty': difficulty,
+        'minValue': minValue,
+        'maxValue': maxValue,
+        'operators': list(operators),
+        'count': count,
+        'weights': weights,
+        'owner': data['o'],
+        'nonce': data['n'],
+        }
@@ -0,0 +1,167 @@
+"""capacity.py
+
+Sharded seat counters for Conference registration.
+
+A Conference's available seats are split across NUM_SHARDS root SeatShard
+entities. Taking or returning a seat touches one randomly picked shard, so
+concurrent registrations for the same Conference no longer contend on one
+entity group. A seat is only taken from a shard with seats left, inside
+the caller's transaction, so the total can never be oversold.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import SeatShard
+
+NUM_SHARDS = 10
+MEMCACHE_SEATS_KEY = "SEATS_AVAILABLE:%s"
+SEATS_CACHE_TIME = 60
+
+# Conference.seatsAvailable is written back at most once per interval
+SYNC_INTERVAL = 10
+SYNC_URL = '/tasks/sync_seats_available'
+
+
+def _shardKeys(c_key):
+    """Return the SeatShard keys for a Conference key.
+    """
+
+    wsck = c_key.urlsafe()
+    return [ndb.Key(SeatShard, '%s-%d' % (wsck, i)) \
+        for i in range(NUM_SHARDS)]
+
+
+def _split(seats):
+    """Split seats as evenly as possible across NUM_SHARDS.
+    """
+
+    portion, remainder = divmod(max(seats, 0), NUM_SHARDS)
+    return [portion + (1 if i < remainder else 0) \
+        for i in range(NUM_SHARDS)]
+
+
+def createShards(c_key, seats):
+    """Create the SeatShards for a new Conference.
+    """
+
+    ndb.put_multi([SeatShard(key=s_key, seats=n) \
+        for s_key, n in zip(_shardKeys(c_key), _split(seats))])
+    memcache.set(MEMCACHE_SEATS_KEY % c_key.urlsafe(), max(seats, 0),
+        time=SEATS_CACHE_TIME)
+
+
+def countSeats(c_key):
+    """Return the seats available for a Conference, from memcache when
+    possible. Creates the SeatShards of Conferences made before seats
+    were sharded, seeded from Conference.seatsAvailable.
+    """
+
+    cache_key = MEMCACHE_SEATS_KEY % c_key.urlsafe()
+    seats = memcache.get(cache_key)
+    if seats is not None:
+        return seats
+
+    s_keys = _shardKeys(c_key)
+    shards = ndb.get_multi(s_keys)
+    if not all(shards):
+        conf = c_key.get()
+        if not conf:
+            return 0
+        portions = _split(conf.seatsAvailable)
+        shards = [shard or SeatShard.get_or_insert(s_key.id(), seats=n) \
+            for shard, s_key, n in zip(shards, s_keys, portions)]
+
+    seats = sum(shard.seats for shard in shards)
+    memcache.add(cache_key, seats, time=SEATS_CACHE_TIME)
+    return seats
+
+
+def _onSeatsChanged(c_key, delta, onChange=None):
+    """Adjust the cached seat count and schedule a write-back to
+    Conference.seatsAvailable once the transaction has committed, then
+    call onChange with the new seat count.
+    """
+
+    def callback():
+        wsck = c_key.urlsafe()
+        if delta > 0:
+            seats = memcache.incr(MEMCACHE_SEATS_KEY % wsck, delta)
+        else:
+            seats = memcache.decr(MEMCACHE_SEATS_KEY % wsck, -delta)
+
+        # Named per interval so bursts coalesce into a single task
+        interval = int(time.time()) // SYNC_INTERVAL
+        try:
+            taskqueue.add(
+                name='seats-%s-%d' % (wsck, interval),
+                params={'websafeConferenceKey': wsck},
+                url=SYNC_URL,
+                countdown=SYNC_INTERVAL)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+        if onChange:
+            onChange(countSeats(c_key) if seats is None else seats)
+
+    ndb.get_context().call_on_commit(callback)
+
+
+def takeSeat(c_key, onChange=None):
+    """Take one seat from a random SeatShard with seats left. Must be
+    called in a transaction. Returns False when the Conference is full.
+    onChange is called with the new seat count after commit.
+    """
+
+    s_keys = _shardKeys(c_key)
+    random.shuffle(s_keys)
+    for s_key in s_keys:
+        shard = s_key.get()
+        if shard and shard.seats > 0:
+            shard.seats -= 1
+            shard.put()
+            _onSeatsChanged(c_key, -1, onChange)
+            return True
+    return False
+
+
+def returnSeat(c_key, onChange=None):
+    """Return one seat to a random SeatShard. Must be called in a
+    transaction. onChange is called with the new seat count after commit.
+    """
+
+    s_key = random.choice(_shardKeys(c_key))
+    shard = s_key.get() or SeatShard(key=s_key)
+    shard.seats += 1
+    shard.put()
+    _onSeatsChanged(c_key, 1, onChange)
+
+
+@ndb.transactional()
+def _writeSeatsAvailable(c_key, seats):
+    """Set seatsAvailable on the current Conference entity, keeping any
+    concurrent update to its other fields.
+    """
+
+    conf = c_key.get()
+    if conf and conf.seatsAvailable != seats:
+        conf.seatsAvailable = seats
+        conf.put()
+
+
+def syncSeatsAvailable(c_key):
+    """Write the sharded seat total back to Conference.seatsAvailable,
+    which queries and announcements still read.
+    """
+
+    shards = ndb.get_multi(_shardKeys(c_key))
+    if all(shards):
+        _writeSeatsAvailable(c_key, sum(shard.seats for shard in shards))
@@ -0,0 +1,311 @@
+"""confindex.py
+
+Instance-local inverted index of conferences by city, topic and month.
+
+These dimensions have few values and change rarely, so each instance
+keeps a map of (field, value) to the set of conferences having it, and
+answers queryConferences filter combinations that are only equalities
+on them by set intersection, with no datastore query.
+Conferences are kept in name order, ties broken by websafe key.
+
+Every write to a conference is noted in a memcache change log: a
+generation number and the websafe keys written at the last LOG_SIZE
+generations. The writing instance applies the entity it wrote at once;
+other instances catch up by getting the logged keys, which is strongly
+consistent. An instance only rebuilds the whole index, from a
+keys-only query plus the logged keys, when the log no longer covers
+its generation (including when it has been evicted), and never while
+holding the lock readers wait on.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import base64
+import binascii
+import bisect
+import json
+import random
+import threading
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+INDEXED_FIELDS = ('city', 'topics', 'month')
+MAX_CONFERENCES = 20000
+BATCH_SIZE = 1000
+LOG_SIZE = 100
+CAS_RETRIES = 5
+MEMCACHE_LOG_KEY = "CONF_INDEX_LOG"
+PAGE_TOKEN_PREFIX = 'idx.'
+
+# _lock guards _index; _buildLock lets one thread at a time rebuild it
+_lock = threading.Lock()
+_buildLock = threading.Lock()
+_index = {'generation': None, 'entries': None, 'postings': None,
+    'records': None}
+
+
+class InvalidPageTokenError(ValueError):
+    """The pageToken was not issued by this index."""
+
+
+def _newLog(wsk=None):
+    """Return a new change log, holding one write if wsk is given.
+    """
+
+    # Start from the time plus random bits, so an instance cannot mistake
+    # a log started after an eviction for the one it has applied
+    generation = (int(time.time()) << 20) | random.getrandbits(20)
+    return {'generation': generation,
+        'changes': [(generation, wsk)] if wsk else []}
+
+
+def _currentLog():
+    """Return the change log, starting a new one if it is missing, or
+    None if memcache is unavailable.
+    """
+
+    log = memcache.get(MEMCACHE_LOG_KEY)
+    if log is None:
+        memcache.add(MEMCACHE_LOG_KEY, _newLog())
+        log = memcache.get(MEMCACHE_LOG_KEY)
+    return log
+
+
+def _postings(conf):
+    """Return the (field, value) pairs a conference is indexed under.
+    """
+
+    pairs = set()
+    for field in INDEXED_FIELDS:
+        values = getattr(conf, field, None)
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            pairs.add((field, value))
+    return pairs
+
+
+def _apply(index, wsk, conf):
+    """Replace the indexed copy of the conference with websafe key wsk
+    by conf, or remove it if conf is None. Call with _lock held.
+    """
+
+    old = index['records'].pop(wsk, None)
+    if old:
+        entry, pairs = old
+        del index['entries'][bisect.bisect_left(index['entries'], entry)]
+        for pair in pairs:
+            index['postings'][pair].discard(entry)
+    if conf:
+        entry = (conf.name or '', wsk)
+        pairs = _postings(conf)
+        index['records'][wsk] = (entry, pairs)
+        bisect.insort(index['entries'], entry)
+        for pair in pairs:
+            index['postings'].setdefault(pair, set()).add(entry)
+
+
+def _build(generation, conferences):
+    """Return a new index of conferences at generation, or one marked
+    unavailable if conferences is None or too many to index.
+    """
+
+    if conferences is None or len(conferences) > MAX_CONFERENCES:
+        return {'generation': generation, 'entries': None,
+            'postings': None, 'records': None}
+    index = {'generation': generation, 'entries': [], 'postings': {},
+        'records': {}}
+    for conf in conferences:
+        _apply(index, conf.key.urlsafe(), conf)
+    return index
+
+
+def _changedSince(log, generation):
+    """Return the websafe keys written after generation, or None if the
+    log does not cover every generation since.
+    """
+
+    changes = log['changes']
+    if generation is None or generation > log['generation'] \
+            or not changes or changes[0][0] > generation + 1:
+        return None
+    return [wsk for g, wsk in changes if g > generation]
+
+
+def _rebuild(log):
+    """Rebuild this instance's index from a keys-only query plus the
+    logged keys, which the query may not see yet. Returns False if
+    another thread is already rebuilding it.
+    """
+
+    if not _buildLock.acquire(False):
+        return False
+    try:
+        keys = ndb.Query(kind='Conference').fetch(
+            MAX_CONFERENCES + 1, keys_only=True, batch_size=BATCH_SIZE)
+        conferences = None
+        if len(keys) <= MAX_CONFERENCES:
+            keys = set(keys)
+            keys.update(ndb.Key(urlsafe=wsk) for g, wsk in log['changes'])
+            keys = list(keys)
+            conferences = []
+            for i in range(0, len(keys), BATCH_SIZE):
+                conferences.extend(conf for conf in ndb.get_multi(
+                    keys[i:i + BATCH_SIZE]) if conf)
+        index = _build(log['generation'], conferences)
+        with _lock:
+            _index.update(index)
+        return True
+    finally:
+        _buildLock.release()
+
+
+def _applyChanges(generation, newGeneration, changes):
+    """Apply (websafe key, conference or None) changes taking the index
+    from generation to newGeneration, unless it has moved on meanwhile.
+    Call with _lock held.
+    """
+
+    if _index['generation'] != generation or _index['entries'] is None:
+        return
+    for wsk, conf in changes:
+        _apply(_index, wsk, conf)
+    _index['generation'] = newGeneration
+    if len(_index['records']) > MAX_CONFERENCES:
+        _index.update(entries=None, postings=None, records=None)
+
+
+def _refresh():
+    """Bring this instance's index up to the logged generation. Returns
+    True if the index can be used.
+    """
+
+    log = _currentLog()
+    if log is None:
+        return False
+    with _lock:
+        generation = _index['generation']
+        available = _index['entries'] is not None
+    if generation != log['generation']:
+        changed = _changedSince(log, generation) if available else None
+        if changed is None:
+            if not _rebuild(log):
+                return False
+        else:
+            # Gets by key see every logged write
+            conferences = ndb.get_multi(
+                [ndb.Key(urlsafe=wsk) for wsk in changed])
+            with _lock:
+                _applyChanges(generation, log['generation'],
+                    zip(changed, conferences))
+    with _lock:
+        return _index['entries'] is not None
+
+
+def noteWrite(conf):
+    """Log a written conference for every instance and apply it to this
+    instance's index. Call after a conference's name, city, topics or
+    month is written, once committed.
+    """
+
+    wsk = conf.key.urlsafe()
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        log = client.gets(MEMCACHE_LOG_KEY)
+        if log is None:
+            # A new log makes every instance rebuild
+            log = _newLog(wsk)
+            if client.add(MEMCACHE_LOG_KEY, log):
+                break
+            continue
+        log['generation'] += 1
+        log['changes'] = log['changes'][-(LOG_SIZE - 1):] + [
+            (log['generation'], wsk)]
+        if client.cas(MEMCACHE_LOG_KEY, log):
+            break
+    else:
+        # Too much contention; start a new log holding this write
+        log = _newLog(wsk)
+        memcache.set(MEMCACHE_LOG_KEY, log)
+
+    with _lock:
+        _applyChanges(log['generation'] - 1, log['generation'],
+            [(wsk, conf)])
+
+
+def warm():
+    """Build this instance's index if it is stale. Returns the user ids
+    of the conferences' organizers.
+    """
+
+    if not _refresh():
+        return []
+    with _lock:
+        entries = list(_index['entries'])
+    return list(set(ndb.Key(urlsafe=wsk).parent().id() \
+        for name, wsk in entries))
+
+
+def canServe(inequality_filter, filters):
+    """Return True if formatted filters are only equalities on indexed
+    fields.
+    """
+
+    return not inequality_filter and all(
+        f['operator'] == '=' and f['field'] in INDEXED_FIELDS \
+        for f in filters)
+
+
+def _encodeToken(entry):
+    return PAGE_TOKEN_PREFIX + base64.urlsafe_b64encode(
+        json.dumps(entry).encode('utf-8')).decode('ascii')
+
+
+def _decodeToken(token):
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(
+            str(token[len(PAGE_TOKEN_PREFIX):])).decode('utf-8')))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidPageTokenError('Invalid pageToken: %s' % token)
+
+
+def isPageToken(token):
+    """Return True if a pageToken was issued by fetchPage.
+    """
+
+    return bool(token) and token.startswith(PAGE_TOKEN_PREFIX)
+
+
+def fetchPage(filters, limit, pageToken=None):
+    """Return (conference keys, nextPageToken) for equality filters that
+    canServe, or None if the index is unavailable. Raises
+    InvalidPageTokenError.
+    """
+
+    last = _decodeToken(pageToken) if pageToken else None
+    if not _refresh():
+        return None
+
+    with _lock:
+        if _index['entries'] is None:
+            return None
+
+        # Intersect from the smallest posting set up
+        sets = sorted([_index['postings'].get((f['field'], f['value']),
+            set()) for f in filters], key=len)
+        if sets:
+            matches = sorted(sets[0].intersection(*sets[1:]))
+        else:
+            matches = _index['entries']
+
+        # Matches are in (name, websafe key) order; resume after the
+        # token's entry
+        start = bisect.bisect_right(matches, last) if last else 0
+        page = matches[start:start + limit]
+        more = start + limit < len(matches)
+
+    nextPageToken = _encodeToken(page[-1]) if more else None
+    return [ndb.Key(urlsafe=wsk) for name, wsk in page], nextPageToken
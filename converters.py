@@ -0,0 +1,80 @@
+"""converters.py
+
+Entity to ProtoRPC form converters for the MathQuizer API.
+
+The field plan for each (model, form) pair is worked out once, from the
+model's properties and the form's fields, and then reused for every
+entity converted: which fields to copy, which to format as strings
+(dates, times and datetimes) and where websafeKey comes from.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import operator
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+_plans = {}
+
+
+def _websafeKey(entity):
+    return entity.key.urlsafe()
+
+
+def _formatted(getter):
+    """Wrap getter so that non-empty values are converted to strings.
+    """
+
+    def get(entity):
+        value = getter(entity)
+        return str(value) if value is not None else None
+    return get
+
+
+def _buildPlan(model_cls, form_cls):
+    """Return the (field name, getter) pairs to copy from model_cls
+    entities into form_cls messages.
+    """
+
+    plan = []
+    for field in form_cls.all_fields():
+        prop = getattr(model_cls, field.name, None)
+        if isinstance(prop, ndb.Property):
+            getter = operator.attrgetter(field.name)
+
+            # Date, time and datetime properties go out as strings
+            if isinstance(prop, ndb.DateTimeProperty) \
+                    and isinstance(field, messages.StringField):
+                getter = _formatted(getter)
+            plan.append((field.name, getter))
+        elif field.name == 'websafeKey':
+            plan.append((field.name, _websafeKey))
+    return tuple(plan)
+
+
+def getPlan(model_cls, form_cls):
+    """Return the cached field plan for a (model, form) pair.
+    """
+
+    plan = _plans.get((model_cls, form_cls))
+    if plan is None:
+        plan = _plans[(model_cls, form_cls)] = _buildPlan(
+            model_cls, form_cls)
+    return plan
+
+
+def toForm(entity, form_cls, fields=None):
+    """Copy entity into a new form_cls message using its field plan,
+    limited to the given field names (and websafeKey) if any.
+    """
+
+    form = form_cls()
+    for name, getter in getPlan(type(entity), form_cls):
+        if fields and name not in fields and name != 'websafeKey':
+            continue
+        value = getter(entity)
+        if value is not None:
+            setattr(form, name, value)
+    return form
@@ -0,0 +1,181 @@
+"""leaderboard.py
+
+Live class leaderboards kept in memcache.
+
+Each teacher's class has one cached board: its best CACHE_SIZE students
+ranked by running percent then correct answers, whether that is the
+whole class, and the user ids of the class's students (to check who
+may read it). Graded quizzes update the board with compare-and-set, so
+a read is a single memcache get. A student whose score drops below the
+board's last entry leaves it, since unlisted students may now rank
+higher; the board is rebuilt from the datastore by a task when it gets
+too short, when it is older than RECONCILE_INTERVAL or when it is
+missing. Rebuild tasks are named by a per-class generation that each
+rebuild advances, so many polling readers queue one rebuild, and a
+board lost after a rebuild queues the next one at once; each instance
+remembers the rebuild it queued, so its polls in between make no
+taskqueue call. A rebuild only
+replaces the board with compare-and-set, so updates made while it
+runs are not lost.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import hashlib
+import time
+
+from google.appengine.api import memcache
+
+import namedtasks
+from models import Student
+
+LEADERBOARD_SIZE = 10
+CACHE_SIZE = 2 * LEADERBOARD_SIZE
+RECONCILE_INTERVAL = 300
+RECONCILE_URL = '/tasks/reconcile_leaderboard'
+MEMCACHE_LEADERBOARD_KEY = "LEADERBOARD:%s"
+MEMCACHE_GENERATION_KEY = "LEADERBOARD_GENERATION:%s"
+CAS_RETRIES = 5
+BATCH_SIZE = 500
+
+
+def _rank(entry):
+    """Return the sort key of a (percent, correct, total, websafe key,
+    displayName) entry.
+    """
+
+    return entry[0], entry[1]
+
+
+def _entry(student):
+    return (student.percent, student.correct, student.total,
+        student.key.urlsafe(), student.displayName)
+
+
+def _generation(p_key, generation=None):
+    """Return the class's rebuild generation, given it if already read,
+    or None if memcache is unavailable.
+    """
+
+    key = MEMCACHE_GENERATION_KEY % p_key.id()
+    if generation is None:
+        # Start from the time so an evicted generation is not reused
+        memcache.add(key, int(time.time()))
+        generation = memcache.get(key)
+    return generation
+
+
+def scheduleReconcile(p_key, generation=None):
+    """Queue a rebuild of the teacher's board, once per generation.
+    """
+
+    generation = _generation(p_key, generation)
+    if generation is None:
+        generation = 'i%d' % (int(time.time()) // RECONCILE_INTERVAL)
+    namedtasks.addOnce(
+        'leaderboard-%s' % hashlib.md5(
+            p_key.urlsafe().encode('utf-8')).hexdigest(),
+        generation,
+        RECONCILE_URL,
+        params={'websafeProfileKey': p_key.urlsafe()})
+
+
+def _buildBoard(p_key):
+    """Return a board for the teacher's Students, read from the
+    datastore.
+    """
+
+    members = set()
+    entries = []
+    for student in Student.query(Student.teacher == p_key).iter(
+            batch_size=BATCH_SIZE):
+        if student.user_id:
+            members.add(student.user_id)
+        if student.total:
+            entries.append(_entry(student))
+    entries.sort(key=_rank, reverse=True)
+
+    now = time.time()
+    return {
+        'entries': entries[:CACHE_SIZE],
+        'complete': len(entries) <= CACHE_SIZE,
+        'members': members,
+        'reconciled': now,
+        'updated': now,
+        }
+
+
+def reconcile(p_key):
+    """Rebuild the teacher's board from their Students, then advance the
+    class's rebuild generation so the next rebuild can be queued.
+    """
+
+    key = MEMCACHE_LEADERBOARD_KEY % p_key.id()
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        # Rebuild again if the board changed while being rebuilt
+        cached = client.gets(key)
+        board = _buildBoard(p_key)
+        if cached is None:
+            if client.add(key, board):
+                break
+        elif client.cas(key, board):
+            break
+    memcache.incr(MEMCACHE_GENERATION_KEY % p_key.id(),
+        initial_value=int(time.time()))
+
+
+def recordScore(p_key, student):
+    """Move a student on the teacher's cached board after a graded quiz.
+    """
+
+    entry = _entry(student)
+    key = MEMCACHE_LEADERBOARD_KEY % p_key.id()
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        board = client.gets(key)
+
+        # Nothing cached; the next read queues a rebuild
+        if board is None:
+            return
+
+        old = board['entries']
+        entries = [e for e in old if e[3] != entry[3]]
+
+        # Unlisted students rank at most the last entry, so a student
+        # may only be placed at or above it unless all are listed
+        if board['complete'] or not old or _rank(entry) >= _rank(old[-1]):
+            entries.append(entry)
+            entries.sort(key=_rank, reverse=True)
+        if len(entries) > CACHE_SIZE:
+            entries = entries[:CACHE_SIZE]
+            board['complete'] = False
+        board['entries'] = entries
+        if student.user_id:
+            board['members'].add(student.user_id)
+        board['updated'] = time.time()
+        if client.cas(key, board):
+            return
+
+    # Too much contention; rebuild from the datastore
+    memcache.delete(key)
+    scheduleReconcile(p_key)
+
+
+def getBoard(p_key):
+    """Return the teacher's cached board, or None, queueing a rebuild if
+    it is missing, stale or too short. Never reads the datastore.
+    """
+
+    # The generation comes with the board, in the same memcache call
+    key = MEMCACHE_LEADERBOARD_KEY % p_key.id()
+    generationKey = MEMCACHE_GENERATION_KEY % p_key.id()
+    cached = memcache.get_multi([key, generationKey])
+    board = cached.get(key)
+    if board is None \
+            or board['reconciled'] + RECONCILE_INTERVAL < time.time() \
+            or (not board['complete'] \
+                and len(board['entries']) < LEADERBOARD_SIZE):
+        scheduleReconcile(p_key, cached.get(generationKey))
+    return board
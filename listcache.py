@@ -0,0 +1,72 @@
+"""listcache.py
+
+Cached list view summaries of conferences and sessions.
+
+List endpoints given a fields selector that only asks for summary
+fields run their query keys-only and read each result's summary (the
+few properties list views show) from memcache, falling back to one
+get_multi for the misses. A keys-only query and a memcache hit cost no
+entity reads, and only the selected fields are sent back.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+SUMMARY_VERSION = 1
+MEMCACHE_SUMMARY_PREFIX = "SUMMARY:v%d:" % SUMMARY_VERSION
+SUMMARY_TIME = 24 * 3600
+
+# Properties kept per kind; seatsAvailable changes too often to cache
+SUMMARY_FIELDS = {
+    'Conference': ('name', 'city', 'topics', 'month', 'startDate',
+        'endDate', 'maxAttendees', 'organizerUserId'),
+    'Session': ('name', 'speaker', 'typeOfSession', 'date', 'startTime',
+        'location', 'durationInMinutes'),
+    }
+
+
+def covers(kind, fields):
+    """Return True if the selected fields can all be served from
+    summaries of kind.
+    """
+
+    return bool(fields) and set(fields) <= set(
+        SUMMARY_FIELDS[kind] + ('websafeKey',))
+
+
+def _summarize(entity):
+    return dict((name, getattr(entity, name, None)) \
+        for name in SUMMARY_FIELDS[entity.key.kind()])
+
+
+def getSummaries(keys):
+    """Return an entity holding just the summary properties for each
+    key found, in order.
+    """
+
+    if not keys:
+        return []
+    wsks = [key.urlsafe() for key in keys]
+    summaries = memcache.get_multi(wsks, key_prefix=MEMCACHE_SUMMARY_PREFIX)
+
+    missing = [key for key, wsk in zip(keys, wsks) if wsk not in summaries]
+    if missing:
+        fetched = dict((entity.key.urlsafe(), _summarize(entity)) \
+            for entity in ndb.get_multi(missing) if entity)
+        memcache.set_multi(fetched, time=SUMMARY_TIME,
+            key_prefix=MEMCACHE_SUMMARY_PREFIX)
+        summaries.update(fetched)
+
+    return [ndb.Model._lookup_model(key.kind())(key=key, **summaries[wsk]) \
+        for key, wsk in zip(keys, wsks) if wsk in summaries]
+
+
+def invalidate(keys):
+    """Drop the cached summaries of written entities.
+    """
+
+    memcache.delete_multi([key.urlsafe() for key in keys],
+        key_prefix=MEMCACHE_SUMMARY_PREFIX)
@@ -0,0 +1,92 @@
+"""localstubs.py
+
+In-memory App Engine services for running the API off App Engine.
+
+The API code calls ndb, memcache, taskqueue and urlfetch directly;
+those go through the SDK's API proxy, so plugging the SDK's in-memory
+service stubs into it (with testbed) runs the unmodified code in a
+plain Python process: an in-memory datastore with a configurable
+consistency policy, memcache, the queues from queue.yaml, urlfetch,
+mail, app_identity and users. Endpoints users are signed in through
+the environment, as the endpoints frontend does.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+AUTH_DOMAIN = 'gmail.com'
+
+
+def setupSdkPath(sdk_path=None):
+    """Put the App Engine SDK (sdk_path, $APPENGINE_SDK or the directory
+    of dev_appserver.py on the PATH) and its libraries on sys.path.
+    """
+
+    if sdk_path is None:
+        sdk_path = os.environ.get('APPENGINE_SDK')
+    if sdk_path is None:
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            if os.path.exists(os.path.join(directory, 'dev_appserver.py')):
+                sdk_path = os.path.dirname(os.path.realpath(
+                    os.path.join(directory, 'dev_appserver.py')))
+                break
+    if sdk_path is None:
+        raise ImportError('App Engine SDK not found; set APPENGINE_SDK.')
+
+    if sdk_path not in sys.path:
+        sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def activate(consistency=1.0, email='user@example.com'):
+    """Plug in-memory service stubs into the API proxy and sign in email.
+    consistency is the probability a datastore write is applied at once
+    for non-ancestor queries (1.0 is strongly consistent). Returns the
+    testbed, to deactivate() when done.
+    """
+
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.setup_env(overwrite=True, app_id='mathquizer-local')
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.\
+            PseudoRandomHRConsistencyPolicy(probability=consistency))
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    bed.init_urlfetch_stub()
+    bed.init_mail_stub()
+    bed.init_app_identity_stub()
+    bed.init_user_stub()
+    ndb.get_context().clear_cache()
+    signIn(email)
+    return bed
+
+
+def signIn(email):
+    """Make endpoints.get_current_user() return a user for email.
+    """
+
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = AUTH_DOMAIN
+
+
+def newRequest(request_id):
+    """Start a new simulated request: request-scoped caches are reset,
+    as they would be between real requests.
+    """
+
+    from google.appengine.ext import ndb
+
+    os.environ['REQUEST_LOG_ID'] = str(request_id)
+    ndb.get_context().clear_cache()
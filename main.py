@@ -1,79 +1,109 @@
+import json
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
-from quizer import QuizerApi
-from models import Session
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
-MEMCACHE_SPEAKER_KEY = "FEATURED_SPEAKER"
+
+class RefreshAnnouncementHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild the nearly sold out announcement in Memcache.
+        """
+        import announcements
+        announcements.refresh()
 
 
-class SetAnnouncementHandler(webapp2.RequestHandler):
-    def get(self):
-        """Set Announcement in Memcache.
+class FlushOutboxHandler(webapp2.RequestHandler):
+    def post(self):
+        """Send the queued confirmation emails, one per recipient.
         """
-        ConferenceApi._cacheAnnouncement()
+        import outbox
+        outbox.flush()
 
 
-class SendConfirmationEmailHandler(webapp2.RequestHandler):
+class FlushAnswerEventsHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation.
+        """Write the buffered answer events to their quiz attempts.
         """
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-            )
-
-
-class SendConfirmationEmailHandler2(webapp2.RequestHandler):
+        import answerlog
+        answerlog.flush()
+
+
+class FlushReportUpdatesHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Session creation.
+        """Apply the queued graded attempts to their class reports.
         """
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Session!',               # subj
-            'Hi, you have created a following '         # body
-            'session:\r\n\r\n%s' % self.request.get(
-                'sessionInfo')
-            )
-
-class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
+        import rollups
+        rollups.flush()
+
+
+class SyncSeatsAvailableHandler(webapp2.RequestHandler):
     def post(self):
-        """Check if the specified speaker has multiple sessions, 
-        then cache them in Memcache as the featured speaker.
+        """Write a Conference's sharded seat count back to the Conference.
         """
-        websafeConferenceKey = self.request.get('websafeConferenceKey')
-        speaker = self.request.get('speaker')
+        import capacity
+        capacity.syncSeatsAvailable(
+            ndb.Key(urlsafe=self.request.get('websafeConferenceKey')))
+
 
-        # Get all sessions with this speaker listed.
-        s = Session.query(ancestor=ndb.Key(
-            urlsafe=websafeConferenceKey))
-        speakerSessions = s.filter(
-            Session.speaker == speaker)
+class ReconcileLeaderboardHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild a class leaderboard in Memcache from the datastore.
+        """
+        import leaderboard
+        leaderboard.reconcile(
+            ndb.Key(urlsafe=self.request.get('websafeProfileKey')))
+
+
+class MetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Dump the per-endpoint latency and RPC metrics as JSON; 
+        ?reset=1 clears them.
+        """
+        import metrics
+        if self.request.get('reset'):
+            metrics.reset()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(metrics.summary(), indent=2))
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load the API and the modules its endpoints import on first 
+        use, and fill the hot caches, before the instance takes traffic.
+        """
+        # Importing quizer builds the API class ahead of the first request
+        import quizer
+        import adaptive
+        import announcements
+        import answerlog
+        import bundles
+        import capacity
+        import confindex
+        import leaderboard
+        import listcache
+        import outbox
+        import profiles
+        import queryplan
+        import rollups
+        import tokens
 
-        # Use a for loop to gather only the names
-        speakerSessionNames = [
-            sess.name for sess in speakerSessions]
+        # index.yaml for the query planner, and Google's id token signing
+        # keys, from memcache when another instance has fetched them
+        queryplan.declaredIndexes()
+        tokens.preloadCerts()
+        announcements.getAnnouncement()
 
-        # If there is more than one session for this speaker, join them all
-        # back together with the speaker name and put it in memcache
-        if len(speakerSessionNames) > 1:
-            cache_string = speaker + ': ' + ', '.join(speakerSessionNames)
-            memcache.set(MEMCACHE_SPEAKER_KEY, cache_string)
+        # Conferences index, and organizer names for conference lists
+        profiles.getDisplayNamesAsync(confindex.warm()).get_result()
 
 
 app = webapp2.WSGIApplication([
-	('/crons/set_announcement', SetAnnouncementHandler),
-    ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-    ('/tasks/send_confirmation_email2', SendConfirmationEmailHandler2),
-    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler)
+    ('/tasks/refresh_announcement', RefreshAnnouncementHandler),
+    ('/tasks/flush_outbox', FlushOutboxHandler),
+    ('/tasks/flush_answer_events', FlushAnswerEventsHandler),
+    ('/tasks/flush_report_updates', FlushReportUpdatesHandler),
+    ('/tasks/sync_seats_available', SyncSeatsAvailableHandler),
+    ('/tasks/reconcile_leaderboard', ReconcileLeaderboardHandler),
+    ('/_admin/metrics', MetricsHandler),
+    ('/_ah/warmup', WarmupHandler)
     ], debug=True)
@@ -0,0 +1,71 @@
+"""memberships.py
+
+Keyed Profile membership index.
+
+Conference registrations and wishlisted sessions are stored as small
+Membership children of the Profile, keyed by kind and websafe key, in
+place of repeated properties on the Profile itself. Checking membership
+is a single keyed get, listing is an (optionally paged) keys-only
+ancestor query, and adding or removing one never rewrites the Profile.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+from google.appengine.ext import ndb
+
+from models import Membership
+
+CONFERENCE = 'conference'
+WISHLIST = 'wishlist'
+
+KINDS = (CONFERENCE, WISHLIST)
+
+
+def _key(p_key, kind, wsk):
+    """Return the Membership key for a websafe key in a Profile's kind.
+    """
+
+    return ndb.Key(Membership, '%s:%s' % (kind, wsk), parent=p_key)
+
+
+def isMember(p_key, kind, wsk):
+    """Return True if the websafe key is in the Profile's kind.
+    """
+
+    return _key(p_key, kind, wsk).get() is not None
+
+
+def add(p_key, kind, wsk):
+    """Add a websafe key to the Profile's kind.
+    """
+
+    Membership(key=_key(p_key, kind, wsk), kind=kind).put()
+
+
+def remove(p_key, kind, wsk):
+    """Remove a websafe key from the Profile's kind.
+    """
+
+    _key(p_key, kind, wsk).delete()
+
+
+def query(p_key, kind):
+    """Return a keys-only query for the Profile's kind; see websafeKeys.
+    """
+
+    return Membership.query(Membership.kind == kind, ancestor=p_key)
+
+
+def websafeKeys(keys):
+    """Return the websafe keys of Membership keys.
+    """
+
+    return [key.id().split(':', 1)[1] for key in keys]
+
+
+def listKeys(p_key, kind):
+    """Return every websafe key in the Profile's kind.
+    """
+
+    return websafeKeys(query(p_key, kind).fetch(keys_only=True))
@@ -0,0 +1,199 @@
+"""metrics.py
+
+Per-endpoint latency and RPC instrumentation.
+
+Endpoint methods decorated with instrumented() record, for every call,
+the wall time in a latency histogram plus the number of API RPCs made
+per service (datastore_v3, memcache, taskqueue, ...) and the bytes
+they sent and received, counted by an API proxy hook. Records are
+kept in process and merged into one memcache aggregate at most every
+FLUSH_INTERVAL seconds, piggybacked on a call, so instrumentation
+costs a few dictionary updates per request; /_admin/metrics dumps the
+aggregate.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import bisect
+import functools
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+    10000, 30000, 60000)
+
+FLUSH_INTERVAL = 60
+MEMCACHE_METRICS_KEY = "METRICS"
+CAS_RETRIES = 5
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = {}
+_lastFlush = [time.time()]
+
+
+def _newRecord():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'millis': 0.0,
+        'buckets': [0] * (len(BUCKETS_MS) + 1),
+        'rpcs': {},
+        'bytes': 0,
+        }
+
+
+def _merge(into, record):
+    """Add record's counts to into.
+    """
+
+    for name in ('calls', 'errors', 'millis', 'bytes'):
+        into[name] += record[name]
+    into['buckets'] = [a + b for a, b in zip(
+        into['buckets'], record['buckets'])]
+    for service, count in record['rpcs'].items():
+        into['rpcs'][service] = into['rpcs'].get(service, 0) + count
+
+
+def _rpcHook(service, call, request, response, rpc=None, error=None):
+    """API proxy post-call hook counting the current call's RPCs.
+    """
+
+    record = getattr(_local, 'record', None)
+    if record is None:
+        return
+    record['rpcs'][service] = record['rpcs'].get(service, 0) + 1
+    try:
+        record['bytes'] += request.ByteSize() + response.ByteSize()
+    except Exception:
+        pass
+
+
+def _installHook():
+    """Install the RPC counting hook once per instance.
+    """
+
+    hooks = apiproxy_stub_map.apiproxy.GetPostCallHooks()
+    hooks.Append('metrics', _rpcHook)
+
+_installHook()
+
+
+def instrumented(method):
+    """Decorator recording an endpoint method's latency and RPCs. Place
+    it below @endpoints.method.
+    """
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, request):
+        _local.record = record = _newRecord()
+        start = time.time()
+        try:
+            return method(self, request)
+        except Exception:
+            record['errors'] += 1
+            raise
+        finally:
+            _local.record = None
+            millis = 1000 * (time.time() - start)
+            record['calls'] = 1
+            record['millis'] = millis
+            record['buckets'][bisect.bisect_left(BUCKETS_MS, millis)] += 1
+            _record(name, record)
+    return wrapper
+
+
+def _record(name, record):
+    """Add a call's record to the pending records, flushing them when
+    FLUSH_INTERVAL has passed.
+    """
+
+    with _lock:
+        _merge(_pending.setdefault(name, _newRecord()), record)
+        if time.time() - _lastFlush[0] < FLUSH_INTERVAL:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _lastFlush[0] = time.time()
+    flush(pending)
+
+
+def flush(pending):
+    """Merge {endpoint: record} into the memcache aggregate.
+    """
+
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        data = client.gets(MEMCACHE_METRICS_KEY)
+        if data is None:
+            data = {'since': time.time(), 'endpoints': {}}
+            for name, record in pending.items():
+                _merge(data['endpoints'].setdefault(name, _newRecord()),
+                    record)
+            if client.add(MEMCACHE_METRICS_KEY, data):
+                return
+            continue
+        for name, record in pending.items():
+            _merge(data['endpoints'].setdefault(name, _newRecord()), record)
+        if client.cas(MEMCACHE_METRICS_KEY, data):
+            return
+    logging.warning('Dropped metrics for %d endpoints after %d attempts',
+        len(pending), CAS_RETRIES)
+
+
+def percentile(buckets, p):
+    """Return the upper bound, in milliseconds, of the histogram bucket
+    holding the p-th percentile (None past the last bound).
+    """
+
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = max(1, -(-total * p // 100))
+    seen = 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if seen >= rank:
+            return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+
+
+def summary():
+    """Return the aggregate metrics per endpoint, most total time
+    first, as plain data.
+    """
+
+    data = memcache.get(MEMCACHE_METRICS_KEY) \
+        or {'since': None, 'endpoints': {}}
+    endpoints = []
+    for name, record in data['endpoints'].items():
+        calls = record['calls'] or 1
+        endpoints.append({
+            'endpoint': name,
+            'calls': record['calls'],
+            'errors': record['errors'],
+            'meanMs': round(record['millis'] / calls, 1),
+            'p50Ms': percentile(record['buckets'], 50),
+            'p90Ms': percentile(record['buckets'], 90),
+            'p99Ms': percentile(record['buckets'], 99),
+            'rpcs': record['rpcs'],
+            'rpcsPerCall': round(
+                sum(record['rpcs'].values()) / float(calls), 1),
+            'bytes': record['bytes'],
+            })
+    endpoints.sort(key=lambda e: -e['meanMs'] * e['calls'])
+    return {'since': data['since'], 'endpoints': endpoints}
+
+
+def reset():
+    """Clear the memcache aggregate.
+    """
+
+    memcache.delete(MEMCACHE_METRICS_KEY)
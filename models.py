@@ -13,16 +13,139 @@ class Profile(ndb.Model):
     user_id             = ndb.StringProperty()
     displayName         = ndb.StringProperty()
     mainEmail           = ndb.StringProperty()
-    studentKeys             = ndb.StringProperty(repeated=True)
 
 
-# Define the Student Kind
+# Define the Membership Kind, a child of the Profile keyed by kind and 
+# websafe key (conference registrations, wishlisted sessions)
+class Membership(ndb.Model):
+    """Membership -- Profile membership index object"""
+    kind                = ndb.StringProperty()
+    created             = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
+
+class TypeOfSession(messages.Enum):
+    """TypeOfSession -- session type enumeration value"""
+    NOT_SPECIFIED = 1
+    Keynote = 2
+    Lecture = 3
+    Workshop = 4
+
+
+# Define the Conference Kind, a child of the organizer's Profile
+class Conference(ndb.Model):
+    """Conference -- Conference object"""
+    name                = ndb.StringProperty(required=True)
+    description         = ndb.StringProperty()
+    organizerUserId     = ndb.StringProperty()
+    topics              = ndb.StringProperty(repeated=True)
+    city                = ndb.StringProperty()
+    startDate           = ndb.DateProperty()
+    month               = ndb.IntegerProperty()
+    endDate             = ndb.DateProperty()
+    maxAttendees        = ndb.IntegerProperty()
+    seatsAvailable      = ndb.IntegerProperty()
+
+
+# Define the Session Kind, a child of the Conference
+class Session(ndb.Model):
+    """Session -- Conference session object"""
+    name                = ndb.StringProperty(required=True)
+    highlights          = ndb.StringProperty()
+    speaker             = ndb.StringProperty()
+    durationInMinutes   = ndb.IntegerProperty()
+    typeOfSession       = msgprop.EnumProperty(TypeOfSession)
+    date                = ndb.DateProperty()
+    startTime           = ndb.TimeProperty()
+    location            = ndb.StringProperty()
+
+
+# Define the Student Kind, a root entity (its own entity group, so 
+# students' graded quizzes are written in parallel) pointing to the 
+# teacher's Profile
 class Student(ndb.Model):
-    """Profile -- User profile object"""
+    """Student -- Student object with running score totals"""
+    teacher             = ndb.KeyProperty(kind='Profile')
     user_id             = ndb.StringProperty()
     displayName         = ndb.StringProperty()
     mainEmail           = ndb.StringProperty()
-    score               = ndb.StringProperty()
+    correct             = ndb.IntegerProperty(default=0)
+    total               = ndb.IntegerProperty(default=0)
+    percent             = ndb.IntegerProperty(default=0)
+    operatorCorrect     = ndb.IntegerProperty(repeated=True, indexed=False)
+    operatorTotal       = ndb.IntegerProperty(repeated=True, indexed=False)
+    lastAttempt         = ndb.DateTimeProperty()
+
+
+# Define the QuizResult Kind, a child of the Student or Profile graded
+class QuizResult(ndb.Model):
+    """QuizResult -- Graded quiz object"""
+    user_id             = ndb.StringProperty()
+    seed                = ndb.IntegerProperty()
+    difficulty          = ndb.StringProperty()
+    correct             = ndb.IntegerProperty()
+    total               = ndb.IntegerProperty()
+    percent             = ndb.IntegerProperty()
+    operatorCorrect     = ndb.IntegerProperty(repeated=True, indexed=False)
+    operatorTotal       = ndb.IntegerProperty(repeated=True, indexed=False)
+    marks               = ndb.BooleanProperty(repeated=True, indexed=False)
+    created             = ndb.DateTimeProperty(auto_now_add=True)
+
+
+# Define the AnswerAttempt Kind, a child of the Student or Profile 
+# answering, keyed by a hash of the client's attempt id and the quiz
+class AnswerAttempt(ndb.Model):
+    """AnswerAttempt -- Per-answer events of one quiz attempt object"""
+    user_id             = ndb.StringProperty()
+    seed                = ndb.IntegerProperty()
+    attemptId           = ndb.StringProperty()
+    events              = ndb.JsonProperty()
+    answered            = ndb.IntegerProperty(indexed=False)
+    correct             = ndb.IntegerProperty(indexed=False)
+    updated             = ndb.DateTimeProperty(auto_now=True)
+
+
+# Define the ClassReport Kind, a child of the teacher's Profile
+class ClassReport(ndb.Model):
+    """ClassReport -- Class score rollup object"""
+    students            = ndb.IntegerProperty(indexed=False)
+    percentSum          = ndb.IntegerProperty(indexed=False)
+    percentHistogram    = ndb.IntegerProperty(repeated=True, indexed=False)
+    operatorCorrect     = ndb.IntegerProperty(repeated=True, indexed=False)
+    operatorTotal       = ndb.IntegerProperty(repeated=True, indexed=False)
+    operatorHistogram   = ndb.IntegerProperty(repeated=True, indexed=False)
+    appliedTasks        = ndb.StringProperty(repeated=True, indexed=False)
+    updated             = ndb.DateTimeProperty(auto_now=True)
+
+
+# Define the AdaptiveStats Kind, a child of the Student or Profile graded
+class AdaptiveStats(ndb.Model):
+    """AdaptiveStats -- Decayed per-operator performance statistics object"""
+    data                = ndb.BlobProperty()
+    updated             = ndb.DateTimeProperty(auto_now=True)
+
+
+# Define the Secret Kind, an app signing secret keyed by use
+class Secret(ndb.Model):
+    """Secret -- App signing secret object"""
+    secret              = ndb.BlobProperty()
+
+
+# Define the SeatShard Kind, one shard of a Conference's available seats
+class SeatShard(ndb.Model):
+    """SeatShard -- Conference seat counter shard object"""
+    seats               = ndb.IntegerProperty(default=0, indexed=False)
+
+
+# Define the SpeakerIndex Kind, a child of the Conference
+class SpeakerIndex(ndb.Model):
+    """SpeakerIndex -- Conference speaker to session names index object"""
+    sessions            = ndb.JsonProperty()
+    featured            = ndb.StringProperty(indexed=False)
 
 
 class QuizForm(messages.Message):
@@ -33,6 +156,47 @@ class QuizForm(messages.Message):
     score = messages.StringField(4)
 
 
+class QueryForm(messages.Message):
+    """QueryForm -- query inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+
+class QueryForms(messages.Message):
+    """QueryForms -- multiple QueryForm inbound form message, paged, with 
+    an optional selector of the fields to return"""
+    filters = messages.MessageField(QueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
+    fields = messages.StringField(4, repeated=True)
+
+
+class LeaderboardEntryForm(messages.Message):
+    """LeaderboardEntryForm -- leaderboard student outbound form message"""
+    rank = messages.IntegerField(1)
+    displayName = messages.StringField(2)
+    percent = messages.IntegerField(3)
+    correct = messages.IntegerField(4)
+    total = messages.IntegerField(5)
+    websafeStudentKey = messages.StringField(6)
+
+
+class LeaderboardForm(messages.Message):
+    """LeaderboardForm -- class leaderboard outbound form message"""
+    items = messages.MessageField(LeaderboardEntryForm, 1, repeated=True)
+    updated = messages.StringField(2)
+
+
+class QueryPlanForm(messages.Message):
+    """QueryPlanForm -- query plan outbound form message. Indexes are 
+    listed as comma separated property names"""
+    orders = messages.StringField(1, repeated=True)
+    indexes = messages.StringField(2, repeated=True)
+    missingIndexes = messages.StringField(3, repeated=True)
+    rewritten = messages.BooleanField(4)
+
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
@@ -42,4 +206,203 @@ class ProfileForm(messages.Message):
     """ProfileForm -- Profile outbound form message"""
     displayName = messages.StringField(1)
     mainEmail = messages.StringField(2)
-    studentKeys = messages.StringField(3, repeated=True)
\ No newline at end of file
+
+
+class StringMessage(messages.Message):
+    """StringMessage -- outbound (single) string message"""
+    data = messages.StringField(1, required=True)
+
+
+class BooleanMessage(messages.Message):
+    """BooleanMessage -- outbound Boolean value message"""
+    data = messages.BooleanField(1)
+
+
+class ConferenceForm(messages.Message):
+    """ConferenceForm -- Conference outbound form message"""
+    name = messages.StringField(1)
+    description = messages.StringField(2)
+    organizerUserId = messages.StringField(3)
+    topics = messages.StringField(4, repeated=True)
+    city = messages.StringField(5)
+    startDate = messages.StringField(6)
+    month = messages.IntegerField(7)
+    maxAttendees = messages.IntegerField(8)
+    seatsAvailable = messages.IntegerField(9)
+    endDate = messages.StringField(10)
+    websafeKey = messages.StringField(11)
+    organizerDisplayName = messages.StringField(12)
+
+
+class ConferenceForms(messages.Message):
+    """ConferenceForms -- multiple Conference outbound form message,
+    paged"""
+    items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class SessionForm(messages.Message):
+    """SessionForm -- Session outbound form message"""
+    name = messages.StringField(1)
+    highlights = messages.StringField(2)
+    speaker = messages.StringField(3)
+    durationInMinutes = messages.IntegerField(4)
+    typeOfSession = messages.EnumField(TypeOfSession, 5)
+    date = messages.StringField(6)
+    startTime = messages.StringField(7)
+    location = messages.StringField(8)
+    websafeConferenceKey = messages.StringField(9)
+    websafeKey = messages.StringField(10)
+
+
+class SessionForms(messages.Message):
+    """SessionForms -- multiple Session outbound form message, paged"""
+    items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class MembershipForms(messages.Message):
+    """MembershipForms -- page of Profile membership websafe keys"""
+    websafeKeys = messages.StringField(1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+class QuizRequestForm(messages.Message):
+    """QuizRequestForm -- generateQuiz inbound form message. weights, if 
+    given, has one weight per operator"""
+    count = messages.IntegerField(1)
+    operators = messages.StringField(2, repeated=True)
+    difficulty = messages.StringField(3)
+    minValue = messages.IntegerField(4)
+    maxValue = messages.IntegerField(5)
+    seed = messages.IntegerField(6)
+    weights = messages.IntegerField(7, repeated=True)
+
+
+class QuizForms(messages.Message):
+    """QuizForms -- multiple QuizForm outbound form message"""
+    items = messages.MessageField(QuizForm, 1, repeated=True)
+    quiz = messages.MessageField(QuizRequestForm, 2)
+
+
+class AnswersForm(messages.Message):
+    """AnswersForm -- submitAnswers inbound form message"""
+    quiz = messages.MessageField(QuizRequestForm, 1)
+    answers = messages.IntegerField(2, repeated=True)
+    websafeStudentKey = messages.StringField(3)
+    elapsedMillis = messages.IntegerField(4, repeated=True)
+
+
+class NextQuizForm(messages.Message):
+    """NextQuizForm -- nextQuiz inbound form message"""
+    websafeStudentKey = messages.StringField(1)
+    count = messages.IntegerField(2)
+
+
+class QuizBundleRequestForm(messages.Message):
+    """QuizBundleRequestForm -- getQuizBundle inbound form message. 
+    Without a quiz the bundle is adaptive"""
+    quiz = messages.MessageField(QuizRequestForm, 1)
+    websafeStudentKey = messages.StringField(2)
+    count = messages.IntegerField(3)
+
+
+class QuizBundleForm(messages.Message):
+    """QuizBundleForm -- offline quiz bundle outbound form message. 
+    Problem i is integer1[i] operators[i] integer2[i]; answerHashes[i] 
+    is the first 8 hex digits of sha256('nonce:i:answer')"""
+    integer1 = messages.IntegerField(1, repeated=True)
+    integer2 = messages.IntegerField(2, repeated=True)
+    operators = messages.StringField(3)
+    answerHashes = messages.StringField(4, repeated=True)
+    nonce = messages.StringField(5)
+    expires = messages.IntegerField(6)
+    token = messages.StringField(7)
+
+
+class BundleAnswersForm(messages.Message):
+    """BundleAnswersForm -- submitBundle inbound form message"""
+    token = messages.StringField(1)
+    answers = messages.IntegerField(2, repeated=True)
+    elapsedMillis = messages.IntegerField(3, repeated=True)
+
+
+class AnswerEventForm(messages.Message):
+    """AnswerEventForm -- recordAnswer inbound form message. eventId is 
+    chosen by the client and identifies retries of the same answer; 
+    attemptId, also chosen by the client, tells retakes of a quiz apart"""
+    quiz = messages.MessageField(QuizRequestForm, 1)
+    index = messages.IntegerField(2)
+    answer = messages.IntegerField(3)
+    eventId = messages.StringField(4)
+    elapsedMillis = messages.IntegerField(5)
+    websafeStudentKey = messages.StringField(6)
+    attemptId = messages.StringField(7)
+
+
+class QuizResultForm(messages.Message):
+    """QuizResultForm -- graded quiz outbound form message"""
+    correct = messages.IntegerField(1)
+    total = messages.IntegerField(2)
+    marks = messages.BooleanField(3, repeated=True)
+    websafeKey = messages.StringField(4)
+    percent = messages.IntegerField(5)
+    created = messages.StringField(6)
+
+
+class QuizResultForms(messages.Message):
+    """QuizResultForms -- multiple QuizResultForm outbound form message"""
+    items = messages.MessageField(QuizResultForm, 1, repeated=True)
+
+
+class StudentForm(messages.Message):
+    """StudentForm -- Student outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    correct = messages.IntegerField(3)
+    total = messages.IntegerField(4)
+    percent = messages.IntegerField(5)
+    lastAttempt = messages.StringField(6)
+    websafeKey = messages.StringField(7)
+
+
+class StudentForms(messages.Message):
+    """StudentForms -- multiple StudentForm outbound form message"""
+    items = messages.MessageField(StudentForm, 1, repeated=True)
+
+
+class StudentQueryForm(messages.Message):
+    """StudentQueryForm -- Student query inbound form message"""
+    minPercent = messages.IntegerField(1)
+    maxPercent = messages.IntegerField(2)
+    limit = messages.IntegerField(3)
+
+
+class RosterForm(messages.Message):
+    """RosterForm -- importRoster inbound form message. Students are given
+    either as parallel displayNames/mainEmails lists or as csv lines of 
+    displayName,mainEmail"""
+    displayNames = messages.StringField(1, repeated=True)
+    mainEmails = messages.StringField(2, repeated=True)
+    csv = messages.StringField(3)
+
+
+class RosterResultForm(messages.Message):
+    """RosterResultForm -- importRoster outbound form message"""
+    imported = messages.IntegerField(1)
+    websafeStudentKeys = messages.StringField(2, repeated=True)
+
+
+class ClassReportForm(messages.Message):
+    """ClassReportForm -- class report outbound form message. 
+    operatorHistogram holds, per operator, counts of students by accuracy 
+    decile (0-9%, ..., 90-99%, 100%)"""
+    students = messages.IntegerField(1)
+    meanPercent = messages.IntegerField(2)
+    p25Percent = messages.IntegerField(3)
+    medianPercent = messages.IntegerField(4)
+    p75Percent = messages.IntegerField(5)
+    p90Percent = messages.IntegerField(6)
+    operators = messages.StringField(7, repeated=True)
+    operatorPercent = messages.IntegerField(8, repeated=True)
+    operatorHistogram = messages.IntegerField(9, repeated=True)
+    updated = messages.StringField(10)
@@ -0,0 +1,53 @@
+"""namedtasks.py
+
+Named push tasks queued at most once.
+
+Flushes and rebuilds are triggered by named tasks, so however many
+requests ask for one, the task queue runs it once per name. Each
+instance also remembers the last name it queued per prefix and skips
+the taskqueue RPC while asking for the same one again, so only the
+first request of a window (or generation) on each instance pays for it.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import time
+
+from google.appengine.api import taskqueue
+
+MAX_PREFIXES = 1000
+
+# Name this instance last queued, per prefix
+_scheduled = {}
+
+
+def addOnce(prefix, suffix, url, countdown=None, params=None):
+    """Queue the task named prefix-suffix unless this instance already
+    has. A task of that name already queued or run counts as queued.
+    """
+
+    name = '%s-%s' % (prefix, suffix)
+    if _scheduled.get(prefix) == name:
+        return
+    try:
+        taskqueue.add(
+            name=name,
+            url=url,
+            countdown=countdown,
+            params=params)
+    except (taskqueue.TaskAlreadyExistsError,
+            taskqueue.TombstonedTaskError):
+        pass
+    if len(_scheduled) >= MAX_PREFIXES:
+        _scheduled.clear()
+    _scheduled[prefix] = name
+
+
+def scheduleFlush(prefix, url, window, countdown=None):
+    """Queue the flush task for the current window of window seconds,
+    once, to run countdown seconds from now (default: window).
+    """
+
+    addOnce(prefix, int(time.time()) // window, url,
+        countdown=window if countdown is None else countdown)
@@ -0,0 +1,97 @@
+"""outbox.py
+
+Batched confirmation mail outbox.
+
+Mails are queued as tasks on the mail-outbox pull queue, tagged by
+recipient. The first mail queued in each window also schedules one
+named flush task; the flush worker leases everything in the outbox,
+coalesces the messages for each recipient into a single mail and sends
+them in one pass. Messages are only deleted once sent, so delivery is
+at least once.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import json
+import logging
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import taskqueue
+
+import namedtasks
+
+OUTBOX_QUEUE = 'mail-outbox'
+OUTBOX_WINDOW = 60
+FLUSH_URL = '/tasks/flush_outbox'
+LEASE_SECONDS = 300
+MAX_TASKS = 1000
+
+
+def enqueueMail(to, subject, body):
+    """Queue a mail for the next outbox flush.
+    """
+
+    taskqueue.Queue(OUTBOX_QUEUE).add(taskqueue.Task(
+        payload=json.dumps({'subject': subject, 'body': body}),
+        method='PULL',
+        tag=to))
+    namedtasks.scheduleFlush('outbox', FLUSH_URL, OUTBOX_WINDOW)
+
+
+def _sendCoalesced(to, messages):
+    """Send all messages for one recipient as a single mail.
+    """
+
+    if len(messages) == 1:
+        subject = messages[0]['subject']
+    else:
+        subject = 'You have %d new MathQuizer notifications' % len(messages)
+    mail.send_mail(
+        'noreply@%s.appspotmail.com' % (
+            app_identity.get_application_id()),     # from
+        to,                                         # to
+        subject,                                    # subj
+        '\r\n\r\n'.join(m['body'] for m in messages)  # body
+        )
+
+
+def flush():
+    """Lease every queued mail, coalesce per recipient and send them.
+    Returns the number of mails sent.
+    """
+
+    queue = taskqueue.Queue(OUTBOX_QUEUE)
+    sent = 0
+    retry = False
+    while True:
+        tasks = queue.lease_tasks(LEASE_SECONDS, MAX_TASKS)
+        if not tasks:
+            break
+
+        # Group the leased messages by recipient
+        byRecipient = {}
+        for task in tasks:
+            byRecipient.setdefault(task.tag, []).append(task)
+
+        done = []
+        for to, recipientTasks in byRecipient.items():
+            try:
+                _sendCoalesced(to, [json.loads(task.payload) \
+                    for task in recipientTasks])
+            except Exception:
+                # Leave the tasks to be leased again after LEASE_SECONDS
+                logging.exception('Could not send outbox mail to %s', to)
+                retry = True
+                continue
+            done.extend(recipientTasks)
+            sent += 1
+        if done:
+            queue.delete_tasks(done)
+
+    # Flush again once the failed messages' leases have expired
+    if retry:
+        namedtasks.scheduleFlush('outbox-retry', FLUSH_URL, OUTBOX_WINDOW,
+            LEASE_SECONDS)
+    return sent
@@ -0,0 +1,146 @@
+"""profiles.py
+
+Cached Profile lookups for the MathQuizer API.
+
+Profiles are looked up by user id through a request-scoped tier and a
+memcache tier before falling back to the datastore. Writes go through
+putProfile(), which refreshes both tiers once the write has committed;
+createProfile() and updateProfile() re-read the entity in a transaction
+first, so a stale cached copy never overwrites a concurrent edit.
+Inside a transaction the caches are bypassed so mutators always read
+the current entity. Display names, needed for every organizer shown in
+a list, are cached separately and can be fetched asynchronously.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import os
+import threading
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Profile
+
+MEMCACHE_PROFILE_KEY = "PROFILE:%s"
+MEMCACHE_DISPLAY_NAME_KEY = "DISPLAY_NAME:%s"
+PROFILE_CACHE_TIME = 600
+
+_local = threading.local()
+
+
+def _requestCache():
+    """Return the Profile cache for the current request.
+    """
+
+    request_id = os.environ.get('REQUEST_LOG_ID')
+    if getattr(_local, 'request_id', None) != request_id:
+        _local.request_id = request_id
+        _local.profiles = {}
+    return _local.profiles
+
+
+def getProfile(user_id):
+    """Return Profile for user_id, or None if there is none.
+    """
+
+    # Transactions must read the entity itself
+    if ndb.in_transaction():
+        return ndb.Key(Profile, user_id).get()
+
+    cache = _requestCache()
+    profile = cache.get(user_id)
+    if profile is not None:
+        return profile
+
+    profile = memcache.get(MEMCACHE_PROFILE_KEY % user_id)
+    if profile is None:
+        profile = ndb.Key(Profile, user_id).get()
+        if profile is None:
+            return None
+        memcache.set(MEMCACHE_PROFILE_KEY % user_id, profile,
+            time=PROFILE_CACHE_TIME)
+    cache[user_id] = profile
+    return profile
+
+
+def putProfile(profile):
+    """Write Profile to the datastore and through to both cache tiers
+    after commit.
+    """
+
+    profile.put()
+    user_id = profile.key.id()
+
+    def callback():
+        _requestCache()[user_id] = profile
+        memcache.set_multi({
+            MEMCACHE_PROFILE_KEY % user_id: profile,
+            MEMCACHE_DISPLAY_NAME_KEY % user_id: profile.displayName or '',
+            }, time=PROFILE_CACHE_TIME)
+
+    ndb.get_context().call_on_commit(callback)
+
+
+@ndb.transactional()
+def createProfile(profile):
+    """Put a new Profile unless one was created meanwhile. Returns the
+    stored Profile.
+    """
+
+    current = profile.key.get()
+    if current is not None:
+        return current
+    putProfile(profile)
+    return profile
+
+
+@ndb.transactional()
+def updateProfile(user_id, values):
+    """Set {field: value} on the current Profile for user_id, read in the
+    transaction so concurrent edits are kept. Returns the Profile, or
+    None if there is none.
+    """
+
+    profile = ndb.Key(Profile, user_id).get()
+    if profile is None:
+        return None
+    for name, value in values.items():
+        setattr(profile, name, value)
+    putProfile(profile)
+    return profile
+
+
+@ndb.tasklet
+def getDisplayNamesAsync(user_ids):
+    """Return a future for {user_id: displayName}, served from the request
+    cache and memcache, with one batch get for the Profiles missing.
+    """
+
+    ctx = ndb.get_context()
+    cache = _requestCache()
+    names = {}
+    for user_id in set(user_ids):
+        if user_id in cache:
+            names[user_id] = cache[user_id].displayName
+
+    # Memcache lookups are batched into a single RPC by the context
+    missing = [user_id for user_id in set(user_ids) if user_id not in names]
+    cached = yield [ctx.memcache_get(MEMCACHE_DISPLAY_NAME_KEY % user_id) \
+        for user_id in missing]
+    for user_id, name in zip(missing, cached):
+        if name is not None:
+            names[user_id] = name
+
+    missing = [user_id for user_id in missing if user_id not in names]
+    if missing:
+        found = yield ndb.get_multi_async(
+            [ndb.Key(Profile, user_id) for user_id in missing])
+        for user_id, profile in zip(missing, found):
+            names[user_id] = (profile and profile.displayName) or ''
+        yield [ctx.memcache_set(MEMCACHE_DISPLAY_NAME_KEY % user_id,
+            names[user_id], time=PROFILE_CACHE_TIME) \
+            for user_id in missing]
+
+    raise ndb.Return(names)
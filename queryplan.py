@@ -0,0 +1,179 @@
+"""queryplan.py
+
+Conference and Session query planner.
+
+Maps the queryConferences/querySessions filter space to the composite
+indexes each query needs and checks them against index.yaml before the
+query runs. Equality-only queries sorted by name are served by merging
+one (field, name) index per filter; a query with an inequality needs a
+single (equality fields..., inequality field, name) index. A query
+whose indexes are not declared is rewritten to drop the secondary
+sort on name when that needs fewer indexes, and rejected otherwise.
+
+Run as a script to print the full set of indexes the filter space
+needs, in index.yaml format.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import collections
+import itertools
+import logging
+import os
+
+OPERATORS = {
+    'EQ':   '=',
+    'GT':   '>',
+    'GTEQ': '>=',
+    'LT':   '<',
+    'LTEQ': '<=',
+    'NE':   '!=',
+    }
+
+FIELDS = {
+    'CITY': 'city',
+    'TOPIC': 'topics',
+    'MONTH': 'month',
+    'MAX_ATTENDEES': 'maxAttendees',
+    }
+
+SFIELDS = {
+    'DURATION_IN_MUNUTES': 'durationInMinutes',
+    }
+
+# Per kind: filterable fields, repeated fields and the secondary sort
+SPACES = {
+    'Conference': (FIELDS, ('topics',), 'name'),
+    'Session':    (SFIELDS, (), 'name'),
+    }
+
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'index.yaml')
+
+Plan = collections.namedtuple('Plan', [
+    'kind',
+    'orders',
+    'indexes',
+    'missing',
+    'rewritten',
+    ])
+
+_declared = []
+
+
+class QueryPlanError(ValueError):
+    """The query cannot be served by any declared index."""
+
+
+def declaredIndexes():
+    """Return the set of (kind, properties) composite indexes declared in
+    index.yaml, or None if it cannot be read.
+    """
+
+    if not _declared:
+        from google.appengine.datastore import datastore_index
+        try:
+            with open(INDEX_FILE) as f:
+                definitions = datastore_index.ParseIndexDefinitions(f)
+        except Exception:
+            logging.warning('Could not read %s; skipping index coverage '
+                'checks', INDEX_FILE, exc_info=True)
+            _declared.append(None)
+        else:
+            _declared.append(set(
+                (index.kind, tuple(prop.name for prop in index.properties)) \
+                for index in definitions.indexes or () \
+                if not index.ancestor and all(
+                    prop.direction in (None, 'asc') \
+                    for prop in index.properties)))
+    return _declared[0]
+
+
+def _indexes(kind, equalities, inequality, sortField):
+    """Return the composite indexes a query needs, each as a tuple of
+    property names.
+    """
+
+    if inequality:
+        if sortField:
+            return [tuple(sorted(equalities)) + (inequality, sortField)]
+        return [tuple(sorted(equalities)) + (inequality,)] \
+            if equalities else []
+    if sortField:
+        return [(field, sortField) for field in sorted(equalities)]
+    return []
+
+
+def plan(kind, inequality, filters, declared=None):
+    """Return the Plan for a query on kind given its inequality field and
+    formatted filters (dicts with field and operator). declared defaults
+    to declaredIndexes(). Raises QueryPlanError.
+    """
+
+    repeated, sortField = SPACES[kind][1:]
+    if declared is None:
+        declared = declaredIndexes()
+
+    counts = collections.Counter(f['field'] for f in filters \
+        if f['operator'] == '=' and f['field'] != inequality)
+    equalities = set(counts)
+
+    # A repeated field filtered more than once needs itself in one
+    # index several times, which explodes the index for every entity
+    if inequality and any(counts[field] > 1 for field in repeated):
+        raise QueryPlanError('Only one %s value can be combined with an '
+            'inequality filter.' % '/'.join(repeated))
+
+    orders = [inequality] if inequality else []
+    indexes = _indexes(kind, equalities, inequality, sortField)
+    missing = [i for i in indexes if declared is not None and \
+        (kind, i) not in declared]
+    if not missing:
+        return Plan(kind, orders + [sortField], indexes, [], False)
+
+    # Try again without the secondary sort
+    fallback = _indexes(kind, equalities, inequality, None)
+    stillMissing = [i for i in fallback if (kind, i) not in declared]
+    if stillMissing:
+        raise QueryPlanError('This filter combination is not supported '
+            '(no index on %s).' % ', '.join(stillMissing[0]))
+    logging.warning('Rewrote %s query without %s sort; missing indexes: '
+        '%s', kind, sortField, missing)
+    return Plan(kind, orders, fallback, missing, True)
+
+
+def requiredIndexes():
+    """Return every (kind, properties) composite index the filter space
+    can need, in a stable order.
+    """
+
+    required = []
+    for kind in sorted(SPACES):
+        fields, repeated, sortField = SPACES[kind]
+        names = sorted(fields.values())
+        for inequality in [None] + names:
+            others = [name for name in names if name != inequality]
+            for size in range(len(others) + 1):
+                for equalities in itertools.combinations(others, size):
+                    for index in _indexes(
+                            kind, equalities, inequality, sortField):
+                        if (kind, index) not in required:
+                            required.append((kind, index))
+    return required
+
+
+def indexYaml():
+    """Return requiredIndexes() as index.yaml entries.
+    """
+
+    lines = []
+    for kind, properties in requiredIndexes():
+        lines.append('- kind: %s' % kind)
+        lines.append('  properties:')
+        lines.extend('  - name: %s' % name for name in properties)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(indexYaml())
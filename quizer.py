@@ -11,11 +11,56 @@ from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
-
-from models import WishlistForm
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+from models import ConflictException
+from models import Profile
+from models import ProfileMiniForm
+from models import ProfileForm
+from models import StringMessage
+from models import BooleanMessage
+from models import Conference
+from models import ConferenceForm
+from models import ConferenceForms
+from models import Session
+from models import SessionForm
+from models import SessionForms
+from models import TypeOfSession
+from models import QueryForms
+from models import QuizForm
+from models import QuizForms
+from models import QuizRequestForm
+from models import QuizResult
+from models import AnswersForm
+from models import AnswerEventForm
+from models import NextQuizForm
+from models import QuizBundleRequestForm
+from models import QuizBundleForm
+from models import BundleAnswersForm
+from models import QuizResultForm
+from models import QuizResultForms
+from models import Student
+from models import StudentForm
+from models import StudentForms
+from models import StudentQueryForm
+from models import RosterForm
+from models import RosterResultForm
+from models import ClassReportForm
+from models import LeaderboardEntryForm
+from models import LeaderboardForm
+from models import MembershipForms
+from models import SpeakerIndex
+from models import QueryPlanForm
+
+import converters
+import memberships
+import metrics
+import profiles
+import quizgen
 
 from utils import getUserId
 
@@ -23,9 +68,29 @@ from settings import WEB_CLIENT_ID
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT ANNOUNCEMENTS"
 MEMCACHE_SPEAKER_KEY = "FEATURED_SPEAKER"
+MEMCACHE_CONF_SPEAKER_KEY = "FEATURED_SPEAKER:%s"
+SPEAKER_INDEX_ID = 'speakers'
+FEATURED_SPEAKER_CACHE_TIME = 60
+MEMCACHE_STUDENT_OWNERS_KEY = "STUDENT_OWNERS:%s"
+STUDENT_OWNERS_CACHE_TIME = 600
+
+DEFAULTS = {
+    "city": "Default City",
+    "maxAttendees": 0,
+    "seatsAvailable": 0,
+    "topics": [ "Default", "Topic" ],
+    }
+
+CONF_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    )
 
+CONF_POST_REQUEST = endpoints.ResourceContainer(
+    ConferenceForm,
+    websafeConferenceKey=messages.StringField(1),
+    )
 
 WISHLIST_DEL_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
@@ -37,26 +102,57 @@ WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
     websafeSessionKey=messages.StringField(1)
     )
 
-OPERATORS = {
-    'EQ':   '=',
-    'GT':   '>',
-    'GTEQ': '>=',
-    'LT':   '<',
-    'LTEQ': '<=',
-    'NE':   '!=',
-    }
+FEATURED_SPEAKER_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    )
 
-FIELDS = {
-    'CITY': 'city',
-    'TOPIC': 'topics',
-    'MONTH': 'month',
-    'MAX_ATTENDEES': 'maxAttendees',
-    }
+MEMBERSHIP_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    kind=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+    )
 
-SFIELDS = {
-    'DURATION_IN_MUNUTES': 'durationInMinutes',
-    }
+QUIZ_RESULTS_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeStudentKey=messages.StringField(1),
+    limit=messages.IntegerField(2),
+    )
+
+MAX_ROSTER_SIZE = 5000
+PUT_BATCH_SIZE = 500
+
+DEFAULT_QUERY_LIMIT = 50
+MAX_QUERY_LIMIT = 500
+
+LEADERBOARD_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeStudentKey=messages.StringField(1),
+    limit=messages.IntegerField(2),
+    )
+
+QUERY_PLAN_REQUEST = endpoints.ResourceContainer(
+    QueryForms,
+    kind=messages.StringField(5),
+    )
 
+LIST_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    fields=messages.StringField(1, repeated=True),
+    )
+
+CONF_SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    fields=messages.StringField(2, repeated=True),
+    )
+
+# fields is numbered clear of SessionForm's own fields
+SESSION_LIST_REQUEST = endpoints.ResourceContainer(
+    SessionForm,
+    fields=messages.StringField(50, repeated=True),
+    )
 
 @endpoints.api(
     name='mathQuizer', 
@@ -78,11 +174,7 @@ class QuizerApi(remote.Service):
         """
 
         # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                setattr(pf, field.name, 
-                    getattr(prof, field.name))
+        pf = converters.toForm(prof, ProfileForm)
         pf.check_initialized()
         return pf
 
@@ -98,17 +190,16 @@ class QuizerApi(remote.Service):
             raise endpoints.UnauthorizedException(
                 'Authorization required')
 
+        # get Profile through the request and memcache tiers
         user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
+        profile = profiles.getProfile(user_id)
 
         # create new Profile if not there
         if not profile:
-            profile = Profile(
-                key = p_key,
+            profile = profiles.createProfile(Profile(
+                key = ndb.Key(Profile, user_id),
                 displayName = user.nickname(), 
-                mainEmail= user.email())
-            profile.put()
+                mainEmail= user.email()))
 
         # return Profile
         return profile      
@@ -121,14 +212,16 @@ class QuizerApi(remote.Service):
         # get user Profile
         prof = self._getProfileFromUser()
 
-        # if saveProfile(), process user-modifyable fields
+        # if saveProfile(), process user-modifyable fields, writing them 
+        # to the current Profile rather than the cached one
         if save_request:
-            for field in ('displayName'):
-                if hasattr(save_request, field):
-                    val = getattr(save_request, field)
-                    if val:
-                        setattr(prof, field, str(val))
-                        prof.put()
+            values = {}
+            for field in ('displayName',):
+                val = getattr(save_request, field, None)
+                if val:
+                    values[field] = str(val)
+            if values:
+                prof = profiles.updateProfile(prof.key.id(), values) or prof
         return self._copyProfileToForm(prof)
 
 
@@ -139,6 +232,7 @@ class QuizerApi(remote.Service):
         http_method='GET', 
         name='getProfile'
         )
+    @metrics.instrumented
     def getProfile(self, request):
         """Return user profile.
         """
@@ -153,6 +247,7 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='saveProfile'
         )
+    @metrics.instrumented
     def saveProfile(self, request):
         """Update & return user profile.
         """
@@ -160,27 +255,806 @@ class QuizerApi(remote.Service):
         return self._doProfile(request)
 
 
+    @endpoints.method(
+        MEMBERSHIP_GET_REQUEST, 
+        MembershipForms, 
+        path='profile/memberships/{kind}', 
+        http_method='GET', 
+        name='getMemberships'
+        )
+    @metrics.instrumented
+    def getMemberships(self, request):
+        """Return a page of the user's conference registrations 
+        ('conference'), wishlisted sessions ('wishlist') or students 
+        ('student') as websafe keys.
+        """
+
+        prof = self._getProfileFromUser()
+
+        # Students point to the teacher's Profile
+        if request.kind == 'student':
+            keys, nextPageToken = self._fetchPage(
+                Student.query(Student.teacher == prof.key), request, 
+                keys_only=True)
+            wsks = [key.urlsafe() for key in keys]
+        elif request.kind in memberships.KINDS:
+            keys, nextPageToken = self._fetchPage(
+                memberships.query(prof.key, request.kind), request, 
+                keys_only=True)
+            wsks = memberships.websafeKeys(keys)
+        else:
+            raise endpoints.BadRequestException(
+                'Unknown membership kind: %s' % request.kind)
+
+        return MembershipForms(
+            websafeKeys=wsks, 
+            nextPageToken=nextPageToken)
+
+
+# - - - Quiz objects - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+    def _copyQuizToForms(self, quiz):
+        """Copy a generated quizgen.Quiz to QuizForms.
+        """
+
+        qf = QuizForms(
+            items=[QuizForm(
+                integer1=a, 
+                integer2=b, 
+                operator=quizgen.OPERATORS[o]) \
+                for a, b, o in zip(
+                    quiz.integer1, quiz.integer2, quiz.operatorIndexes)],
+            quiz=QuizRequestForm(
+                count=len(quiz.answers),
+                operators=quiz.operators,
+                weights=quiz.weights or [],
+                difficulty=quiz.difficulty,
+                minValue=quiz.minValue,
+                maxValue=quiz.maxValue,
+                seed=quiz.seed))
+        qf.check_initialized()
+        return qf
+
+
+    def _generateQuiz(self, request):
+        """Generate the quiz described by a QuizRequestForm.
+        """
+
+        try:
+            return quizgen.generateQuiz(
+                count=request.count,
+                operators=request.operators,
+                difficulty=request.difficulty,
+                minValue=request.minValue,
+                maxValue=request.maxValue,
+                seed=request.seed,
+                weights=request.weights)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+
+    @endpoints.method(
+        QuizRequestForm, 
+        QuizForms, 
+        path='quiz', 
+        http_method='POST', 
+        name='generateQuiz'
+        )
+    @metrics.instrumented
+    def generateQuiz(self, request):
+        """Generate a whole set of problems in one call. The returned 
+        quiz parameters (including the seed) reproduce the same set.
+        """
+
+        return self._copyQuizToForms(self._generateQuiz(request))
+
+
+    @endpoints.method(
+        AnswersForm, 
+        QuizResultForm, 
+        path='quiz/answers', 
+        http_method='POST', 
+        name='submitAnswers'
+        )
+    @metrics.instrumented
+    def submitAnswers(self, request):
+        """Grade a whole quiz's answers at once and store one result.
+        """
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        if not request.quiz or request.quiz.seed is None:
+            raise endpoints.BadRequestException(
+                "Answers 'quiz' field with a seed required")
+
+        # Regenerate the quiz from its parameters and grade every answer
+        quiz = self._generateQuiz(request.quiz)
+        try:
+            grade = quizgen.gradeQuiz(quiz, request.answers)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+        # Store a single aggregate result, updating the Student's totals
+        s_key = None
+        if request.websafeStudentKey:
+            s_key = self._parseStudentKey(request.websafeStudentKey)
+        result = self._recordQuizResult(
+            user_id, s_key, quiz, grade, request.elapsedMillis)
+        return self._copyQuizResultToForm(result)
+
+
+    @endpoints.method(
+        NextQuizForm, 
+        QuizForms, 
+        path='quiz/next', 
+        http_method='POST', 
+        name='nextQuiz'
+        )
+    @metrics.instrumented
+    def nextQuiz(self, request):
+        """Generate a quiz adapted to the given student's (or else the 
+        user's) recent accuracy and speed per operator. Answers are 
+        submitted with submitAnswers like any other quiz.
+        """
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        owner_key = self._getQuizOwnerKey(user_id, request.websafeStudentKey)
+        return self._copyQuizToForms(self._generateQuiz(
+            self._adaptiveQuizRequest(owner_key, request.count)))
+
+
+    @endpoints.method(
+        AnswerEventForm, 
+        BooleanMessage, 
+        path='quiz/answer', 
+        http_method='POST', 
+        name='recordAnswer'
+        )
+    @metrics.instrumented
+    def recordAnswer(self, request):
+        """Check and record one answer as it is given. Returns whether it 
+        is correct; the answer is stored shortly after, in a batch.
+        """
+
+        import answerlog
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        if not request.quiz or request.quiz.seed is None \
+                or not request.eventId or request.index is None \
+                or request.answer is None:
+            raise endpoints.BadRequestException(
+                "Answer 'quiz' with a seed, 'index', 'answer' and "
+                "'eventId' fields required")
+        owner_key = self._getQuizOwnerKey(user_id, request.websafeStudentKey)
+
+        quiz = self._generateQuiz(request.quiz)
+        if not 0 <= request.index < len(quiz.answers):
+            raise endpoints.BadRequestException(
+                'No problem %d in this quiz.' % request.index)
+        correct = quiz.answers[request.index] == request.answer
+
+        # Buffered; only the queue is written on the answer path
+        answerlog.enqueueAnswer(owner_key, user_id, quiz, 
+            request.attemptId, request.eventId, request.index, 
+            request.answer, correct, request.elapsedMillis)
+        return BooleanMessage(data=correct)
+
+
+    def _parseStudentKey(self, wssk):
+        """Return the Student key for a websafeStudentKey, rejecting 
+        malformed keys and keys of any other kind.
+        """
+
+        try:
+            s_key = ndb.Key(urlsafe=wssk)
+        except (ProtocolBufferDecodeError, TypeError):
+            raise endpoints.BadRequestException(
+                'Invalid student key: %s' % wssk)
+        if s_key.kind() != 'Student' or s_key.parent():
+            raise endpoints.BadRequestException(
+                'Not a student key: %s' % wssk)
+        return s_key
+
+
+    def _getStudentOwners(self, s_key):
+        """Return the user ids of a Student's teacher and of the student 
+        (None if not signed up), cached so that checking who may use a 
+        Student does not read it on every request.
+        """
+
+        cache_key = MEMCACHE_STUDENT_OWNERS_KEY % s_key.urlsafe()
+        owners = memcache.get(cache_key)
+        if owners is None:
+            student = s_key.get()
+            if not student or not student.teacher:
+                raise endpoints.NotFoundException(
+                    'No student found with key: %s' % s_key.urlsafe())
+            owners = (student.teacher.id(), student.user_id)
+            memcache.add(cache_key, owners, time=STUDENT_OWNERS_CACHE_TIME)
+        return owners
+
+
+    def _getQuizOwnerKey(self, user_id, wssk=None):
+        """Return the key quizzes are recorded under: the Student for 
+        websafeStudentKey (teacher or student only), else the user's 
+        Profile.
+        """
+
+        if not wssk:
+            return ndb.Key(Profile, user_id)
+        s_key = self._parseStudentKey(wssk)
+        if user_id not in self._getStudentOwners(s_key):
+            raise endpoints.ForbiddenException(
+                'Only the teacher or the student can get a quiz.')
+        return s_key
+
+
+    def _adaptiveQuizRequest(self, owner_key, count=None):
+        """Return a QuizRequestForm adapted to the owner's statistics.
+        """
+
+        import adaptive
+
+        difficulty, operators, weights = adaptive.nextQuizParameters(
+            adaptive.getStats(owner_key))
+        return QuizRequestForm(
+            count=count,
+            operators=operators,
+            weights=weights,
+            difficulty=difficulty)
+
+
+    @endpoints.method(
+        QuizBundleRequestForm, 
+        QuizBundleForm, 
+        path='quiz/bundle', 
+        http_method='POST', 
+        name='getQuizBundle'
+        )
+    @metrics.instrumented
+    def getQuizBundle(self, request):
+        """Return a whole quiz, with answer hashes, for the client to run 
+        offline and submit with submitBundle. Adaptive unless a quiz is 
+        given.
+        """
+
+        import bundles
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        owner_key = self._getQuizOwnerKey(user_id, request.websafeStudentKey)
+        quiz = self._generateQuiz(request.quiz \
+            or self._adaptiveQuizRequest(owner_key, request.count))
+        token, nonce, expires, hashes = bundles.makeBundle(
+            quiz, owner_key.urlsafe())
+
+        return QuizBundleForm(
+            integer1=list(quiz.integer1),
+            integer2=list(quiz.integer2),
+            operators=''.join(quizgen.OPERATORS[o] \
+                for o in quiz.operatorIndexes),
+            answerHashes=hashes,
+            nonce=nonce,
+            expires=expires,
+            token=token)
+
+
+    @endpoints.method(
+        BundleAnswersForm, 
+        QuizResultForm, 
+        path='quiz/bundle/answers', 
+        http_method='POST', 
+        name='submitBundle'
+        )
+    @metrics.instrumented
+    def submitBundle(self, request):
+        """Verify and grade a quiz bundle's answers and store one result. 
+        Resubmitting the same bundle returns the stored result.
+        """
+
+        import bundles
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        try:
+            bundle = bundles.readBundle(request.token)
+        except bundles.InvalidBundleError as e:
+            raise endpoints.BadRequestException(str(e))
+
+        # Student bundles are checked when recorded; others must be ours
+        owner_key = ndb.Key(urlsafe=bundle['owner'])
+        s_key = None
+        if owner_key.kind() == 'Student':
+            s_key = owner_key
+        elif owner_key != ndb.Key(Profile, user_id):
+            raise endpoints.ForbiddenException(
+                'This bundle belongs to another user.')
+
+        quiz = self._generateQuiz(QuizRequestForm(
+            count=bundle['count'],
+            operators=bundle['operators'],
+            difficulty=bundle['difficulty'],
+            minValue=bundle['minValue'],
+            maxValue=bundle['maxValue'],
+            seed=bundle['seed'],
+            weights=bundle['weights']))
+        try:
+            grade = quizgen.gradeQuiz(quiz, request.answers)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+        result = self._recordQuizResult(
+            user_id, s_key, quiz, grade, request.elapsedMillis, 
+            result_id=bundle['nonce'])
+
+        # A resubmitted bundle returns the stored result, marks included
+        return self._copyQuizResultToForm(result)
+
+
+    def _getStudentKey(self, user_id, wssk):
+        """Return Student key from websafeStudentKey, checking that the 
+        user is the Student's teacher.
+        """
+
+        s_key = self._parseStudentKey(wssk)
+        if self._getStudentOwners(s_key)[0] != user_id:
+            raise endpoints.ForbiddenException(
+                'Only the teacher can access this student.')
+        return s_key
+
+
+    @ndb.transactional()
+    def _recordQuizResult(self, user_id, s_key, quiz, grade, 
+            elapsedMillis=(), result_id=None):
+        """Store graded quiz as a QuizResult, under the Student when given 
+        (adding to the Student's totals) or else under the user's Profile, 
+        and fold it into the adaptive statistics. Only the Student's or 
+        Profile's own entity group is written; the class report is updated 
+        later from a queued task. A result already stored with result_id 
+        is returned unchanged.
+        """
+
+        import adaptive
+        import leaderboard
+        import rollups
+
+        parent = s_key or ndb.Key(Profile, user_id)
+        entities = []
+
+        if s_key:
+            # Check that student exists and that user is the teacher 
+            # or the student
+            student = s_key.get() if s_key.kind() == 'Student' else None
+            if not student or not student.teacher:
+                raise endpoints.NotFoundException(
+                    'No student found with key: %s' % s_key.urlsafe())
+            teacher = student.teacher
+            if user_id not in (teacher.id(), student.user_id):
+                raise endpoints.ForbiddenException(
+                    'Only the teacher or the student can submit answers.')
+
+        if result_id:
+            result = ndb.Key(QuizResult, result_id, parent=parent).get()
+            if result:
+                return result
+
+        if s_key:
+            # Add this quiz to the running totals
+            before = rollups.snapshot(student)
+            size = len(quizgen.OPERATORS)
+            student.correct += grade.correct
+            student.total += grade.total
+            student.percent = quizgen.percent(
+                student.correct, student.total)
+            student.operatorCorrect = [a + b for a, b in zip(
+                student.operatorCorrect or [0] * size, 
+                grade.operatorCorrect)]
+            student.operatorTotal = [a + b for a, b in zip(
+                student.operatorTotal or [0] * size, 
+                grade.operatorTotal)]
+            student.lastAttempt = datetime.utcnow()
+            entities.append(student)
+
+            # Queue the student's move within the class report; it is in 
+            # the teacher's entity group, which a whole class submitting at 
+            # once must not write to
+            rollups.enqueueAttempt(teacher, before, student)
+            ndb.get_context().call_on_commit(
+                lambda: leaderboard.recordScore(teacher, student))
+
+        result = QuizResult(
+            parent=parent,
+            id=result_id,
+            user_id=user_id,
+            seed=quiz.seed,
+            difficulty=quiz.difficulty,
+            correct=grade.correct,
+            total=grade.total,
+            percent=quizgen.percent(grade.correct, grade.total),
+            operatorCorrect=grade.operatorCorrect,
+            operatorTotal=grade.operatorTotal,
+            marks=[bool(m) for m in grade.marks])
+        entities.append(result)
+        entities.append(adaptive.recordQuiz(
+            parent, quiz, grade.marks, elapsedMillis))
+        ndb.put_multi(entities)
+        return result
+
+
+    def _copyQuizResultToForm(self, result):
+        """Copy relevant fields from QuizResult to QuizResultForm.
+        """
+
+        qrf = converters.toForm(result, QuizResultForm)
+        qrf.check_initialized()
+        return qrf
+
+
+    @endpoints.method(
+        QUIZ_RESULTS_GET_REQUEST, 
+        QuizResultForms, 
+        path='quiz/results', 
+        http_method='GET', 
+        name='getQuizResults'
+        )
+    @metrics.instrumented
+    def getQuizResults(self, request):
+        """Return graded quizzes, newest first, for the given student 
+        (teacher only) or else for the user.
+        """
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        if request.websafeStudentKey:
+            ancestor = self._getStudentKey(
+                user_id, request.websafeStudentKey)
+        else:
+            ancestor = ndb.Key(Profile, user_id)
+
+        # Ancestor query served by the (ancestor, -created) index
+        results = QuizResult.query(ancestor=ancestor) \
+            .order(-QuizResult.created) \
+            .fetch(self._queryLimit(request.limit))
+
+        return QuizResultForms(
+            items=[self._copyQuizResultToForm(result) \
+                for result in results])
+
+
+# - - - Student objects - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+    def _queryLimit(self, limit):
+        """Return requested query limit, bounded to MAX_QUERY_LIMIT.
+        """
+
+        if not limit:
+            return DEFAULT_QUERY_LIMIT
+        return max(1, min(limit, MAX_QUERY_LIMIT))
+
+
+    def _fetchPage(self, query, request, **options):
+        """Fetch one page of query results starting at the request's 
+        pageToken. Returns the entities and the next pageToken, if any.
+        """
+
+        try:
+            cursor = Cursor(urlsafe=request.pageToken) \
+                if request.pageToken else None
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % request.pageToken)
+
+        # One bounded batch RPC instead of iterating the whole result
+        items, next_cursor, more = query.fetch_page(
+            self._queryLimit(request.pageSize), start_cursor=cursor, 
+            **options)
+        if more and next_cursor:
+            return items, next_cursor.urlsafe()
+        return items, None
+
+
+    def _getListFields(self, form_cls, fields):
+        """Return a list request's fields selector, checked against 
+        form_cls, or None for whole forms.
+        """
+
+        if not fields:
+            return None
+        names = set(field.name for field in form_cls.all_fields())
+        unknown = [name for name in fields if name not in names]
+        if unknown:
+            raise endpoints.BadRequestException(
+                'Unknown fields: %s' % ', '.join(unknown))
+        return tuple(fields)
+
+
+    def _getListEntities(self, kind, keys, fields):
+        """Return the entities found for keys, as cached summaries when 
+        they cover the selected fields.
+        """
+
+        import listcache
+
+        if listcache.covers(kind, fields):
+            return listcache.getSummaries(keys)
+        return [entity for entity in ndb.get_multi(keys) if entity]
+
+
+    def _runListQuery(self, kind, query, fields):
+        """Run an unpaged list query, keys-only when cached summaries 
+        cover the selected fields.
+        """
+
+        import listcache
+
+        if listcache.covers(kind, fields):
+            return listcache.getSummaries(query.fetch(keys_only=True))
+        return query
+
+
+    def _fetchListPage(self, kind, query, request, fields):
+        """Fetch one page of a list query like _fetchPage, keys-only when 
+        cached summaries cover the selected fields.
+        """
+
+        import listcache
+
+        if listcache.covers(kind, fields):
+            keys, nextPageToken = self._fetchPage(
+                query, request, keys_only=True)
+            return listcache.getSummaries(keys), nextPageToken
+        return self._fetchPage(query, request)
+
+
+    def _copyStudentToForm(self, student):
+        """Copy relevant fields from Student to StudentForm.
+        """
+
+        sf = converters.toForm(student, StudentForm)
+        sf.check_initialized()
+        return sf
+
+
+    @endpoints.method(
+        StudentQueryForm, 
+        StudentForms, 
+        path='queryStudents', 
+        http_method='POST', 
+        name='queryStudents'
+        )
+    @metrics.instrumented
+    def queryStudents(self, request):
+        """Return the teacher's students ordered by percent, highest 
+        first, optionally within [minPercent, maxPercent).
+        """
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        # Filtering and ordering are served by the (teacher, -percent) 
+        # index, so only matching students are read
+        q = Student.query(Student.teacher == ndb.Key(Profile, user_id))
+        if request.minPercent is not None:
+            q = q.filter(Student.percent >= request.minPercent)
+        if request.maxPercent is not None:
+            q = q.filter(Student.percent < request.maxPercent)
+        q = q.order(-Student.percent)
+
+        return StudentForms(
+            items=[self._copyStudentToForm(student) \
+                for student in q.fetch(self._queryLimit(request.limit))])
+
+
+    def _parseRoster(self, request):
+        """Return (displayName, mainEmail) pairs from a RosterForm.
+        """
+
+        if request.csv:
+            import csv
+
+            # the csv module reads UTF-8 encoded bytes
+            rows = [[cell.decode('utf-8') for cell in row] \
+                for row in csv.reader(
+                    request.csv.encode('utf-8').strip().splitlines()) \
+                if row]
+        elif request.mainEmails:
+            if len(request.mainEmails) != len(request.displayNames):
+                raise endpoints.BadRequestException(
+                    "Roster 'mainEmails' must match 'displayNames'")
+            rows = zip(request.displayNames, request.mainEmails)
+        else:
+            rows = [(name,) for name in request.displayNames]
+
+        roster = []
+        for row in rows:
+            name = row[0].strip() if row[0] else ''
+            email = row[1].strip() if len(row) > 1 and row[1] else None
+            if not name:
+                raise endpoints.BadRequestException(
+                    "Every student needs a 'displayName'")
+            roster.append((name, email))
+
+        if not 0 < len(roster) <= MAX_ROSTER_SIZE:
+            raise endpoints.BadRequestException(
+                'Roster must have between 1 and %d students.' \
+                    % MAX_ROSTER_SIZE)
+        return roster
+
+
+    @endpoints.method(
+        RosterForm, 
+        RosterResultForm, 
+        path='roster', 
+        http_method='POST', 
+        name='importRoster'
+        )
+    @metrics.instrumented
+    def importRoster(self, request):
+        """Create Students for a whole class at once for the teacher's 
+        Profile.
+        """
+
+        prof = self._getProfileFromUser()
+        roster = self._parseRoster(request)
+
+        # Allocate every Student ID in a single call; each Student is its 
+        # own entity group
+        p_key = prof.key
+        start, end = Student.allocate_ids(size=len(roster))
+        students = [Student(
+            key=ndb.Key(Student, s_id),
+            teacher=p_key,
+            displayName=name,
+            mainEmail=email) \
+            for s_id, (name, email) in zip(
+                range(start, end + 1), roster)]
+
+        # Write Students in batches of at most PUT_BATCH_SIZE
+        for i in range(0, len(students), PUT_BATCH_SIZE):
+            ndb.put_multi(students[i:i + PUT_BATCH_SIZE])
+
+        # Students are listed by their teacher property, so the Profile 
+        # itself is not rewritten
+        return RosterResultForm(
+            imported=len(students),
+            websafeStudentKeys=[student.key.urlsafe() \
+                for student in students])
+
+
+    @endpoints.method(
+        message_types.VoidMessage, 
+        ClassReportForm, 
+        path='classReport', 
+        http_method='GET', 
+        name='getClassReport'
+        )
+    @metrics.instrumented
+    def getClassReport(self, request):
+        """Return the score report for the teacher's students.
+        """
+
+        import rollups
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        p_key = ndb.Key(Profile, getUserId(user))
+
+        # One entity, whatever the size of the class
+        report = rollups.reportKey(p_key).get() or rollups.newReport(p_key)
+        return ClassReportForm(
+            students=report.students,
+            meanPercent=report.percentSum // report.students \
+                if report.students else 0,
+            p25Percent=rollups.percentile(report, 25),
+            medianPercent=rollups.percentile(report, 50),
+            p75Percent=rollups.percentile(report, 75),
+            p90Percent=rollups.percentile(report, 90),
+            operators=list(quizgen.OPERATORS),
+            operatorPercent=[quizgen.percent(c, t) for c, t in zip(
+                report.operatorCorrect, report.operatorTotal)],
+            operatorHistogram=report.operatorHistogram,
+            updated=str(report.updated) if report.updated else None)
+
+
+    @endpoints.method(
+        LEADERBOARD_GET_REQUEST, 
+        LeaderboardForm, 
+        path='leaderboard', 
+        http_method='GET', 
+        name='getLeaderboard'
+        )
+    @metrics.instrumented
+    def getLeaderboard(self, request):
+        """Return the live leaderboard of the teacher's class, or of the 
+        class of the given student (teacher or student only). Served 
+        from memcache; safe to poll.
+        """
+
+        import leaderboard
+
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException(
+                'Authorization required')
+        user_id = getUserId(user)
+
+        # The class is the teacher's Profile
+        if request.websafeStudentKey:
+            p_key = ndb.Key(Profile, self._getStudentOwners(
+                self._parseStudentKey(request.websafeStudentKey))[0])
+        else:
+            p_key = ndb.Key(Profile, user_id)
+
+        board = leaderboard.getBoard(p_key)
+        if not board:
+            return LeaderboardForm(items=[])
+        if user_id != p_key.id() and user_id not in board['members']:
+            raise endpoints.ForbiddenException(
+                'Only the teacher or a student can see this leaderboard.')
+
+        limit = min(request.limit or leaderboard.LEADERBOARD_SIZE, 
+            leaderboard.LEADERBOARD_SIZE)
+        return LeaderboardForm(
+            items=[LeaderboardEntryForm(
+                rank=rank,
+                displayName=displayName,
+                percent=percent,
+                correct=correct,
+                total=total,
+                websafeStudentKey=wssk) \
+                for rank, (percent, correct, total, wssk, displayName) \
+                in enumerate(board['entries'][:limit], 1)],
+            updated=str(datetime.utcfromtimestamp(board['updated'])))
+
+
 # - - - Conference objects - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
-    def _getQuery(self, request):
-        """Return formatted query from the submitted filters.
+    def _getQuery(self, inequality_filter, filters):
+        """Return formatted query from the formatted filters.
         """
 
         q = Conference.query()
-        inequality_filter, filters = self._formatFilters(
-            request.filters)
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
+        # Sort on inequality filter first, then name if it is indexed
+        plan = self._planQuery('Conference', inequality_filter, filters)
+        for prop in plan.orders:
+            q = q.order(ndb.GenericProperty(prop))
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(
                 filtr["field"], 
                 filtr["operator"], 
@@ -189,10 +1063,26 @@ class QuizerApi(remote.Service):
         return q
 
 
+    def _planQuery(self, kind, inequality_filter, filters):
+        """Return the queryplan.Plan for formatted filters, rejecting 
+        filter combinations no declared index can serve.
+        """
+
+        import queryplan
+
+        try:
+            return queryplan.plan(kind, inequality_filter, filters)
+        except queryplan.QueryPlanError as e:
+            raise endpoints.BadRequestException(str(e))
+
+
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters.
         """
 
+        from queryplan import FIELDS
+        from queryplan import OPERATORS
+
         formatted_filters = []
         inequality_field = None
 
@@ -207,6 +1097,13 @@ class QuizerApi(remote.Service):
                 raise endpoints.BadRequestException(
                     "Filter contains invalid field or operator.")
 
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Filter on %s needs a number." % filtr["field"])
+
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
             # check if inequality operation has been used in previous filters
@@ -224,24 +1121,15 @@ class QuizerApi(remote.Service):
         return (inequality_field, formatted_filters)
 
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm.
+    def _copyConferenceToForm(self, conf, displayName, fields=None):
+        """Copy relevant fields from Conference to ConferenceForm, only 
+        the selected ones if fields are given.
         """
 
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, 
-                        str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, 
-                        getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
+        # dates are converted to date strings by the field plan
+        cf = converters.toForm(conf, ConferenceForm, fields)
+        if displayName and (
+                not fields or 'organizerDisplayName' in fields):
             setattr(cf, 'organizerDisplayName', displayName)
         cf.check_initialized()
         return cf
@@ -251,6 +1139,11 @@ class QuizerApi(remote.Service):
         """Create or update Conference object, returning ConferenceForm/request.
         """
 
+        import announcements
+        import capacity
+        import confindex
+        import outbox
+
         # Fetch current user
         user = endpoints.get_current_user()
         if not user:
@@ -307,13 +1200,21 @@ class QuizerApi(remote.Service):
         data['organizerUserId'] = request.organizerUserId = user_id
 
         # Create Conference
-        Conference(**data).put()
+        conf = Conference(**data)
+        conf.put()
+        confindex.noteWrite(conf)
+
+        # Split the seats across the Conference's seat shards
+        capacity.createShards(c_key, data.get('seatsAvailable') or 0)
+        announcements.seatsChanged(
+            c_key, data['name'], data.get('seatsAvailable') or 0)
 
         # Send email to organizer confirming creation of Conference
-        taskqueue.add(
-            params={'email': user.email(), 
-            'conferenceInfo': repr(request)}, 
-            url='/tasks/send_confirmation_email')
+        outbox.enqueueMail(
+            user.email(), 
+            'You created a new Conference!', 
+            'Hi, you have created a following '
+            'conference:\r\n\r\n%s' % repr(request))
 
         # Return (modified) ConferenceForm
         return request
@@ -326,6 +1227,7 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='createConference'
         )
+    @metrics.instrumented
     def createConference(self, request):
         """Create new conference.
         """
@@ -338,6 +1240,9 @@ class QuizerApi(remote.Service):
         """Updates Conference Object
         """
 
+        import confindex
+        import listcache
+
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException(
@@ -362,6 +1267,14 @@ class QuizerApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        # Seats are counted in the SeatShards, outside this entity group, 
+        # so the seat fields cannot change here
+        for field in ('maxAttendees', 'seatsAvailable'):
+            value = getattr(request, field)
+            if value is not None and value != getattr(conf, field):
+                raise endpoints.BadRequestException(
+                    "Conference '%s' cannot be updated." % field)
+
         # Not getting all the fields, so don't create a new object; just
         # Copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
@@ -376,7 +1289,10 @@ class QuizerApi(remote.Service):
                 # write to Conference object
                 setattr(conf, field.name, data)
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
+        ndb.get_context().call_on_commit(lambda: confindex.noteWrite(conf))
+        ndb.get_context().call_on_commit(
+            lambda: listcache.invalidate([conf.key]))
+        prof = profiles.getProfile(user_id)
         return self._copyConferenceToForm(conf, 
             getattr(prof, 'displayName'))
 
@@ -388,6 +1304,7 @@ class QuizerApi(remote.Service):
         http_method='PUT', 
         name='updateConference'
         )
+    @metrics.instrumented
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info.
         """
@@ -402,16 +1319,49 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='queryConferences'
         )
+    @metrics.instrumented
     def queryConferences(self, request):
         """Query for conferences.
         """
 
-        conferences = self._getQuery(request)
+        import confindex
+
+        inequality_filter, filters = self._formatFilters(request.filters)
+        fields = self._getListFields(ConferenceForm, request.fields)
+
+        # Equality filters on city, topics and month are answered from 
+        # the instance's inverted index when it is available
+        page = None
+        if confindex.canServe(inequality_filter, filters) and (
+                not request.pageToken \
+                or confindex.isPageToken(request.pageToken)):
+            try:
+                page = confindex.fetchPage(filters, 
+                    self._queryLimit(request.pageSize), request.pageToken)
+            except confindex.InvalidPageTokenError as e:
+                raise endpoints.BadRequestException(str(e))
+            if page is not None:
+                page = (self._getListEntities(
+                    'Conference', page[0], fields), page[1])
+
+        # An index page token cannot continue a datastore query
+        if page is None and confindex.isPageToken(request.pageToken):
+            raise endpoints.BadRequestException(
+                'The conference index has expired; restart paging '
+                'without a pageToken.')
+
+        # Key order last keeps cursors valid for != (multi-)queries
+        if page is None:
+            page = self._fetchListPage('Conference', self._getQuery(
+                inequality_filter, filters).order(Conference.key), 
+                request, fields)
+        conferences, nextPageToken = page
 
          # Return individual ConferenceForm object per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") \
-                for conf in conferences])
+            items=[self._copyConferenceToForm(conf, "", fields) \
+                for conf in conferences],
+            nextPageToken=nextPageToken)
 
 
     @endpoints.method(
@@ -421,30 +1371,39 @@ class QuizerApi(remote.Service):
         http_method='GET', 
         name='getConference'
         )
+    @metrics.instrumented
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey).
         """
 
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        import capacity
+
+        # get Conference object and organizer name (the parent Profile's)
+        # at the same time; bail if not found
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf_future = c_key.get_async()
+        names_future = profiles.getDisplayNamesAsync([c_key.parent().id()])
+        conf = conf_future.get_result()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: \
                     %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
 
-        # return ConferenceForm
-        return self._copyConferenceToForm(
-            conf, getattr(prof, 'displayName'))
+        # return ConferenceForm with the current sharded seat count
+        cf = self._copyConferenceToForm(
+            conf, names_future.get_result()[c_key.parent().id()])
+        cf.seatsAvailable = capacity.countSeats(conf.key)
+        return cf
 
 
     @endpoints.method(
-        message_types.VoidMessage, 
+        LIST_GET_REQUEST, 
         ConferenceForms, 
         path='getConferencesCreated', 
         http_method='POST', 
         name='getConferencesCreated'
         )
+    @metrics.instrumented
     def getConferencesCreated(self, request):
         """Return only conferences created by user.
         """
@@ -454,24 +1413,26 @@ class QuizerApi(remote.Service):
             raise endpoints.UnauthorizedException(
                 'Authorization required')
         user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)    
-        conferences = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = p_key.get()
+        fields = self._getListFields(ConferenceForm, request.fields)
+        conferences = self._runListQuery('Conference', Conference.query(
+            ancestor=ndb.Key(Profile, user_id)), fields)
+        prof = profiles.getProfile(user_id)
         displayName = getattr(prof, 'displayName')
 
          # return individual ConferenceForm object per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, displayName) \
+            items=[self._copyConferenceToForm(conf, displayName, fields) \
                 for conf in conferences])
 
 
     @endpoints.method(
-        message_types.VoidMessage, 
+        LIST_GET_REQUEST, 
         ConferenceForms, 
         path='conferences/attending', 
         http_method='GET', 
         name='getConferencesToAttend'
         )
+    @metrics.instrumented
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for.
         """
@@ -480,27 +1441,29 @@ class QuizerApi(remote.Service):
         profile = self._getProfileFromUser() 
 
         # create websafe key
-        conf_keys = [ndb.Key(urlsafe=wsck) \
-            for wsck in profile.conferenceKeysToAttend]
-
-        # get multiple conference keys
-        conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) \
-            for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for prof in profiles:
-            names[prof.key.id()] = prof.displayName
+        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in memberships.listKeys(
+            profile.key, memberships.CONFERENCE)]
+
+        fields = self._getListFields(ConferenceForm, request.fields)
+        if fields and 'organizerDisplayName' not in fields:
+            return ConferenceForms(
+                items=[self._copyConferenceToForm(conf, None, fields) \
+                    for conf in self._getListEntities(
+                        'Conference', conf_keys, fields)])
+
+        # organizers are the parent Profiles of the conference keys, so
+        # conferences and organizer names are fetched at the same time
+        conf_futures = ndb.get_multi_async(conf_keys)
+        names_future = profiles.getDisplayNamesAsync(
+            [c_key.parent().id() for c_key in conf_keys])
+        conferences = [f.get_result() for f in conf_futures]
+        names = names_future.get_result()
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(
-                conf, names[conf.organizerUserId]) \
-                for conf in conferences])
+                conf, names.get(conf.organizerUserId), fields) \
+                for conf in conferences if conf])
 
 
 # - - - Sessions - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
@@ -514,12 +1477,10 @@ class QuizerApi(remote.Service):
         inequality_filter, filters = self._formatSessionFilters(
             request.filters)
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Session.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.name)
+        # Sort on inequality filter first, then name if it is indexed
+        plan = self._planQuery('Session', inequality_filter, filters)
+        for prop in plan.orders:
+            q = q.order(ndb.GenericProperty(prop))
 
         for filtr in filters:
             if filtr["field"] in ["durationInMinutes"]:
@@ -536,6 +1497,9 @@ class QuizerApi(remote.Service):
         """Parse, check validity and format user supplied filters.
         """
 
+        from queryplan import OPERATORS
+        from queryplan import SFIELDS
+
         formatted_filters = []
         inequality_field = None
 
@@ -574,35 +1538,31 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='querySessions'
         )
+    @metrics.instrumented
     def querySessions(self, request):
         """Query for sessions.
         """
 
-        sessions = self._getSessionQuery(request)
+        # Key order last keeps cursors valid for != (multi-)queries
+        fields = self._getListFields(SessionForm, request.fields)
+        sessions, nextPageToken = self._fetchListPage('Session', 
+            self._getSessionQuery(request).order(Session.key), 
+            request, fields)
 
          # return individual SessionsForm object per session
         return SessionForms(
-            items=[self._copySessionToForm(sess) \
-                for sess in sessions])
+            items=[self._copySessionToForm(sess, fields) \
+                for sess in sessions],
+            nextPageToken=nextPageToken)
 
 
-    def _copySessionToForm(self, sess):
-        """Copy relevant fields from Session to SessionForm.
+    def _copySessionToForm(self, sess, fields=None):
+        """Copy relevant fields from Session to SessionForm, only the 
+        selected ones if fields are given.
         """
 
-        sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(sess, field.name):
-
-                # Convert date and startTime to string
-                if field.name == ('date', 'startTime'):
-                    setattr(sf, field.name, str(getattr(sess, field.name)))
-
-                # Copy other fields
-                else:
-                    setattr(sf, field.name, getattr(sess, field.name))
-            elif field.name == "websafeKey":
-                setattr(sf, field.name, sess.key.urlsafe())
+        # date and startTime are converted to strings by the field plan
+        sf = converters.toForm(sess, SessionForm, fields)
         sf.check_initialized()
         return sf
 
@@ -610,6 +1570,8 @@ class QuizerApi(remote.Service):
     def _createSessionObject(self, request):
         """Create or update Session object, returning SessionForm/request."""
 
+        import outbox
+
         # Fetch current user
         user = endpoints.get_current_user()
         if not user:
@@ -655,16 +1617,6 @@ class QuizerApi(remote.Service):
             data['startTime'] = datetime.strptime(
                 data['startTime'][:5], "%H:%M").time()
 
-        # Add speaker to memcache
-        speaker =data['speaker']
-        websafeConferenceKey =data['websafeConferenceKey']
-        taskqueue.add(
-            params={
-            "speaker": speaker,
-            "websafeConferenceKey": websafeConferenceKey}, 
-            url="/tasks/set_featured_speaker")
-
-
         # Make Session Key from Conference ID as p_key
         p_key = ndb.Key(urlsafe=request.websafeConferenceKey)
         
@@ -676,16 +1628,17 @@ class QuizerApi(remote.Service):
         s_key = ndb.Key(Session, s_id, parent=p_key)
         data['key'] = s_key
         del data['websafeConferenceKey']
+        del data['websafeKey']
 
-        # Create Session
-        Session(**data).put()
+        # Create Session, counting it in the conference's speaker index
+        self._putSessionAndSpeaker(Session(**data))
 
         # Send email to organizer confirming creation of Session
-        taskqueue.add(
-            params={
-            'email': user.email(), 
-            'sessionInfo': repr(request)}, 
-            url='/tasks/send_confirmation_email2')
+        outbox.enqueueMail(
+            user.email(), 
+            'You created a new Session!', 
+            'Hi, you have created a following '
+            'session:\r\n\r\n%s' % repr(request))
 
         # Return request
         return request
@@ -698,6 +1651,7 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='createSession'
         )
+    @metrics.instrumented
     def createSession(self, request): 
         """Create new session. Only available for conference organizer
         """
@@ -706,12 +1660,13 @@ class QuizerApi(remote.Service):
 
 
     @endpoints.method(
-        SESS_GET_REQUEST, 
+        CONF_SESSIONS_GET_REQUEST, 
         SessionForms, 
         path='conference/{websafeConferenceKey}/sessions', 
         http_method='GET', 
         name='getConferenceSessions'
         )
+    @metrics.instrumented
     def getConferenceSessions(self, request): 
         """Return requested conference sessions (by websafeConferenceKey).
         """
@@ -726,21 +1681,23 @@ class QuizerApi(remote.Service):
                     %s' % request.websafeConferenceKey)
 
         # Perform ancestor query
-        s = Session.query(ancestor=ndb.Key(
-            urlsafe=request.websafeConferenceKey))
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', Session.query(ancestor=ndb.Key(
+            urlsafe=request.websafeConferenceKey)), fields)
 
         # Return set of SessionForm objects per ancestor
-        return SessionForms(items=[self._copySessionToForm(sess) \
+        return SessionForms(items=[self._copySessionToForm(sess, fields) \
             for sess in s])
 
 
     @endpoints.method(
-        SessionForm, 
+        SESSION_LIST_REQUEST, 
         SessionForms, 
         path='typeOfSession', 
         http_method='GET', 
         name='getConferenceSessionsByType'
         )
+    @metrics.instrumented
     def getConferenceSessionsByType(self, request): 
         """Returns sessions by typeOfSession, across all conferences.
         """
@@ -752,19 +1709,22 @@ class QuizerApi(remote.Service):
         # Perform the query for all key matches for typeOfSession.
         s = s.filter(
             Session.typeOfSession == request.typeOfSession)
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', s, fields)
 
         # Return set of SessionForm objects per typeOfSession
-        return SessionForms(items=[self._copySessionToForm(sess) \
+        return SessionForms(items=[self._copySessionToForm(sess, fields) \
             for sess in s])
 
 
     @endpoints.method(
-        SessionForm, 
+        SESSION_LIST_REQUEST, 
         SessionForms, 
         path='speaker', 
         http_method='GET', 
         name='getSessionsBySpeaker'
         )
+    @metrics.instrumented
     def getSessionsBySpeaker(self, request): 
         """Returns sessions by speaker, across all conferences.
         """
@@ -772,19 +1732,22 @@ class QuizerApi(remote.Service):
         # Perform the query for all key matches for speaker
         s = Session.query()
         s = s.filter(Session.speaker == request.speaker)
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', s, fields)
 
         # Return set of SessionForm objects per speaker
-        return SessionForms(items=[self._copySessionToForm(sess) \
+        return SessionForms(items=[self._copySessionToForm(sess, fields) \
             for sess in s])
 
 
     @endpoints.method(
-        SessionForm, 
+        SESSION_LIST_REQUEST, 
         SessionForms, 
         path='location', 
         http_method='GET', 
         name='getSessionsByLocation'
         )
+    @metrics.instrumented
     def getSessionsByLocation(self, request): 
         """Returns sessions by location, across all conferences.
         """
@@ -792,19 +1755,22 @@ class QuizerApi(remote.Service):
         # Perform the query for all key matches for location
         s = Session.query()
         s = s.filter(Session.location == request.location)
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', s, fields)
 
         # Return set of SessionForm objects per location
-        return SessionForms(items=[self._copySessionToForm(sess) \
+        return SessionForms(items=[self._copySessionToForm(sess, fields) \
             for sess in s])
 
 
     @endpoints.method(
-        SessionForm, 
+        SESSION_LIST_REQUEST, 
         SessionForms, 
         path='datelocationbytime', 
         http_method='GET', 
         name='getSessionsByDateLocationSortByTime'
         )
+    @metrics.instrumented
     def getSessionsByDateLocationSortByTime(self, request): 
         """Returns sessions by date and location, across all conferences,
         orders the results by time.
@@ -831,20 +1797,23 @@ class QuizerApi(remote.Service):
         # Order by date then start time
         s = s.order(Session.date)
         s = s.order(Session.startTime)
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', s, fields)
 
         # Return set of SessionForm objects
         return SessionForms(
-            items=[self._copySessionToForm(sess) \
+            items=[self._copySessionToForm(sess, fields) \
                 for sess in s])
 
 
     @endpoints.method(
-        message_types.VoidMessage, 
+        LIST_GET_REQUEST, 
         SessionForms, 
         path='specialrequest', 
         http_method='GET', 
         name='getAllNonWorkshopsBefore7PM'
         )
+    @metrics.instrumented
     def getAllNonWorkshopsBefore7PM(self, request): 
         """Returns all non-workshop sessions before 7 pm, 
         across all conferences.
@@ -863,10 +1832,12 @@ class QuizerApi(remote.Service):
             Session.typeOfSession == TypeOfSession.Lecture))
         s = s.filter(Session.startTime < t)
         s = s.order(Session.startTime)
+        fields = self._getListFields(SessionForm, request.fields)
+        s = self._runListQuery('Session', s, fields)
 
         # Return set of SessionForm objects per typeOfSession
         return SessionForms(
-            items=[self._copySessionToForm(sess) \
+            items=[self._copySessionToForm(sess, fields) \
                 for sess in s])
 
 
@@ -891,23 +1862,24 @@ class QuizerApi(remote.Service):
                 'No session found with key: %s' % wsck)
 
         # Check if session is already in wishlist otherwise add
+        inWishlist = memberships.isMember(
+            prof.key, memberships.WISHLIST, wsck)
         if addTo:
-            if wsck in prof.wishlistSessionKeys:
+            if inWishlist:
                 raise ConflictException(
                     "You have already added this session to your wishlist")
-            prof.wishlistSessionKeys.append(wsck)
+            memberships.add(prof.key, memberships.WISHLIST, wsck)
             retval = True
 
         # Check if session is in wishlist then remove
         else:
-            if wsck in prof.wishlistSessionKeys:
-                prof.wishlistSessionKeys.remove(wsck)
+            if inWishlist:
+                memberships.remove(prof.key, memberships.WISHLIST, wsck)
                 retval = True
             else:
                 retval = False
 
-        # Put back in datastore and return
-        prof.put()
+        # The Profile itself is not rewritten
         return BooleanMessage(data=retval)
 
 
@@ -918,10 +1890,13 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='addSessionToWishlist'
         )
+    @metrics.instrumented
     def addSessionToWishlist(self, request):
         """Add websafeSessionKey to users profile.
         """
 
+        # fetch (or create) Profile before the wishlist transaction
+        self._getProfileFromUser()
         return self._sessionWishlist(request)
 
 
@@ -932,35 +1907,47 @@ class QuizerApi(remote.Service):
         http_method='DELETE', 
         name='deleteSessionInWishlist'
         )
+    @metrics.instrumented
     def deleteSessionInWishlist(self, request):
         """Remove websafeSessionKey from users profile.
         """
 
+        # fetch (or create) Profile before the wishlist transaction
+        self._getProfileFromUser()
         return self._sessionWishlist(request, addTo=False)
 
 
     @endpoints.method(
-        message_types.VoidMessage, 
+        LIST_GET_REQUEST, 
         SessionForms, 
         path='profile/wishlist', 
         http_method='GET', 
         name='getSessionsInWishlist'
         )
+    @metrics.instrumented
     def getSessionsInWishlist(self, request):
         """ Given a user, returns all sessions in wishlist.
         """
 
+        import listcache
+
         # Fetch user Profile
         prof = self._getProfileFromUser() 
 
-        # Get wishlistSessionKeys from Profile all at once
-        sk = [ndb.Key(urlsafe=wssk) \
-            for wssk in prof.wishlistSessionKeys]
-        wishList = ndb.get_multi(sk)
+        # Get wishlisted session keys from Memberships all at once, converting 
+        # each Session as soon as its result is in
+        sk = [ndb.Key(urlsafe=wssk) for wssk in memberships.listKeys(
+            prof.key, memberships.WISHLIST)]
+        fields = self._getListFields(SessionForm, request.fields)
+        if listcache.covers('Session', fields):
+            return SessionForms(items=[
+                self._copySessionToForm(sess, fields) \
+                for sess in listcache.getSummaries(sk)])
+        futures = ndb.get_multi_async(sk)
 
         # return set of SessionForm objects per Session found in wishList
-        return SessionForms(items=[self._copySessionToForm(sess) \
-            for sess in wishList]
+        return SessionForms(items=[self._copySessionToForm(sess, fields) \
+            for sess in (f.get_result() for f in futures) if sess]
         )
 
 
@@ -972,6 +1959,9 @@ class QuizerApi(remote.Service):
         """Register or unregister user for selected conference.
         """
 
+        import announcements
+        import capacity
+
         retval = None
 
         # Fetch user profile
@@ -984,38 +1974,42 @@ class QuizerApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
+        # keep the nearly sold out announcement in step with seat changes
+        def seatsChanged(seats):
+            announcements.seatsChanged(conf.key, conf.name, seats)
+
         # register
+        registered = memberships.isMember(
+            prof.key, memberships.CONFERENCE, wsck)
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registered:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
+            # take away one seat from a seat shard, if any are left
+            if not capacity.takeSeat(conf.key, seatsChanged):
                 raise ConflictException(
                     "There are no seats available.")
 
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
+            # register user
+            memberships.add(prof.key, memberships.CONFERENCE, wsck)
             retval = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if registered:
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
+                # unregister user, add back one seat to a seat shard
+                memberships.remove(prof.key, memberships.CONFERENCE, wsck)
+                capacity.returnSeat(conf.key, seatsChanged)
                 retval = True
             else:
                 retval = False
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
+        # neither the Profile nor the Conference is rewritten, so 
+        # registrations only write a Membership and a seat shard
         return BooleanMessage(data=retval)
 
 
@@ -1026,10 +2020,17 @@ class QuizerApi(remote.Service):
         http_method='POST', 
         name='registerForConference'
         )
+    @metrics.instrumented
     def registerForConference(self, request):
         """Register user for selected conference.
         """
 
+        import capacity
+
+        # make sure seat shards exist and Profile is fetched (or 
+        # created) before the registration transaction
+        capacity.countSeats(ndb.Key(urlsafe=request.websafeConferenceKey))
+        self._getProfileFromUser()
         return self._conferenceRegistration(request)
 
 
@@ -1040,10 +2041,17 @@ class QuizerApi(remote.Service):
         http_method='DELETE', 
         name='unregisterFromConference'
         )
+    @metrics.instrumented
     def unregisterFromConference(self, request):
         """Unregister user for selected conference.
         """
 
+        import capacity
+
+        # make sure seat shards exist and Profile is fetched (or 
+        # created) before the registration transaction
+        capacity.countSeats(ndb.Key(urlsafe=request.websafeConferenceKey))
+        self._getProfileFromUser()
         return self._conferenceRegistration(request, reg=False)
 
 
@@ -1052,29 +2060,13 @@ class QuizerApi(remote.Service):
 
     @staticmethod
     def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-
-        confs = Conference.query(
-            ndb.AND(
-                Conference.seatsAvailable <= 5, 
-                Conference.seatsAvailable > 0)) \
-                .fetch(projection=[Conference.name])
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences \
-                are nearly sold out:',', '.join(conf.name \
-                    for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-        return announcement
+        """Rebuild the nearly sold out set & assign to memcache; used by
+        the announcement revalidation task.
+        """
+
+        import announcements
+
+        return announcements.refresh()
 
 
     @endpoints.method(
@@ -1084,68 +2076,123 @@ class QuizerApi(remote.Service):
         http_method='GET', 
         name='getAnnouncement'
         )
+    @metrics.instrumented
     def getAnnouncement(self, request):
-        """Return Announcement from memcache.
+        """Return Announcement from the cached nearly sold out set.
         """
 
-        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
-        return StringMessage(data=announcement)
+        import announcements
+
+        return StringMessage(data=announcements.getAnnouncement())
 
 
 # - - - Featured Speaker - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
 
+    @ndb.transactional()
+    def _putSessionAndSpeaker(self, sess):
+        """Put Session and add it to its conference's SpeakerIndex in the
+        same transaction. A speaker with more than one session in the 
+        conference becomes its featured speaker.
+        """
+
+        c_key = sess.key.parent()
+        i_key = ndb.Key(SpeakerIndex, SPEAKER_INDEX_ID, parent=c_key)
+        index = i_key.get()
+
+        # Build the index from existing sessions the first time round, 
+        # storing it even if this session has no speaker
+        built = not index
+        if built:
+            index = SpeakerIndex(key=i_key, sessions={})
+            for s in Session.query(ancestor=c_key):
+                if s.speaker:
+                    index.sessions.setdefault(s.speaker, []).append(s.name)
+
+        entities = [sess]
+        if sess.speaker:
+            names = index.sessions.setdefault(sess.speaker, [])
+            names.append(sess.name)
+            if len(names) > 1:
+                index.featured = sess.speaker + ': ' + ', '.join(names)
+        if sess.speaker or built:
+            entities.append(index)
+        ndb.put_multi(entities)
+
+        # Update the cached featured speakers once committed
+        featured = index.featured
+        def callback():
+            if featured:
+                memcache.set_multi({
+                    MEMCACHE_CONF_SPEAKER_KEY % c_key.urlsafe(): featured,
+                    MEMCACHE_SPEAKER_KEY: featured})
+        ndb.get_context().call_on_commit(callback)
+
+
     @endpoints.method(
-        message_types.VoidMessage, 
+        FEATURED_SPEAKER_REQUEST, 
         StringMessage, 
         path='getFeaturedSpeaker', 
         http_method='POST', 
         name='getFeaturedSpeaker'
         )
+    @metrics.instrumented
     def getFeaturedSpeaker(self, request):
-        """Fetches featured speaker with sessions from memcache.
+        """Fetches featured speaker with sessions for the given conference 
+        from memcache or its speaker index; without a conference, the most 
+        recently featured speaker of any conference.
         """
-        return StringMessage(data=memcache.get(MEMCACHE_SPEAKER_KEY) or '')
 
+        if not request.websafeConferenceKey:
+            return StringMessage(
+                data=memcache.get(MEMCACHE_SPEAKER_KEY) or '')
+
+        cache_key = MEMCACHE_CONF_SPEAKER_KEY % request.websafeConferenceKey
+        featured = memcache.get(cache_key)
+        if featured is None:
+            index = ndb.Key(SpeakerIndex, SPEAKER_INDEX_ID, 
+                parent=ndb.Key(urlsafe=request.websafeConferenceKey)).get()
+            featured = (index and index.featured) or ''
+
+            # add, so a speaker featured meanwhile by a commit callback is 
+            # not overwritten, and briefly, so a missed update heals soon
+            memcache.add(cache_key, featured, 
+                time=FEATURED_SPEAKER_CACHE_TIME)
+        return StringMessage(data=featured)
 
-# - - - Method for testing filters - - - - - - - - - - - - - - - - - - - - - - 
+
+# - - - Query plans - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
 
     @endpoints.method(
-        message_types.VoidMessage, 
-        ConferenceForms, 
-        path='filterTester', 
+        QUERY_PLAN_REQUEST, 
+        QueryPlanForm, 
+        path='queryPlan/{kind}', 
         http_method='POST', 
-        name='filterTester'
+        name='getQueryPlan'
         )
-    def filterTester(self, request):
-        """Playground for testing queries.
+    @metrics.instrumented
+    def getQueryPlan(self, request):
+        """Return how queryConferences ('Conference') or querySessions 
+        ('Session') would run the given filters, without running them.
         """
 
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException(
-                'Authorization required')
-        p_key = ndb.Key(Profile, getUserId(user))    
-
-        field = "city"
-        operator = "<="
-        value = "Paris"
-        filters = ndb.query.FilterNode(field, operator, value)
-
-        q = Conference.query()
-        conferences = q.filter(filters)
-        conferences = q.order(Conference.name)
-        conferences = q.filter(Conference.month == 6)
-
-        prof = p_key.get()
-        displayName = getattr(prof, 'displayName')
-
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") \
-                for conf in conferences])
+        if request.kind == 'Conference':
+            inequality_filter, filters = self._formatFilters(
+                request.filters)
+        elif request.kind == 'Session':
+            inequality_filter, filters = self._formatSessionFilters(
+                request.filters)
+        else:
+            raise endpoints.BadRequestException(
+                'Unknown query kind: %s' % request.kind)
+
+        plan = self._planQuery(request.kind, inequality_filter, filters)
+        return QueryPlanForm(
+            orders=plan.orders + ['__key__'],
+            indexes=[', '.join(index) for index in plan.indexes],
+            missingIndexes=[', '.join(index) for index in plan.missing],
+            rewritten=plan.rewritten)
 
 
 # registers API
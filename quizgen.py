@@ -0,0 +1,217 @@
+"""quizgen.py
+
+MathQuizer batch problem generator.
+
+Problems are built column-wise into parallel arrays (first operands,
+second operands, operator indexes, answers) so a whole quiz is produced
+in one pass and costs one API round trip. Every quiz is reproducible
+from its seed and parameters.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import bisect
+import operator
+import random
+from array import array
+from collections import namedtuple
+
+# Operators in the order used by the operator index arrays
+OPERATORS = ('+', '-', '*', '/')
+
+SOLVERS = (
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.floordiv,
+    )
+
+# Operand ranges for each difficulty band
+DIFFICULTIES = {
+    'EASY':   (0, 10),
+    'MEDIUM': (0, 100),
+    'HARD':   (0, 1000),
+    }
+
+DEFAULT_DIFFICULTY = 'EASY'
+DEFAULT_COUNT = 10
+MAX_COUNT = 100
+MAX_SEED = 2 ** 31 - 1
+
+# Largest operand; products and dividends (up to MAX_VALUE ** 2) must
+# fit the 32 bit 'l' arrays on every platform
+MAX_VALUE = 10000
+MAX_WEIGHT = 100
+
+Quiz = namedtuple('Quiz', [
+    'seed',
+    'difficulty',
+    'minValue',
+    'maxValue',
+    'operators',
+    'weights',
+    'integer1',
+    'integer2',
+    'operatorIndexes',
+    'answers',
+    ])
+
+Grade = namedtuple('Grade', [
+    'marks',
+    'correct',
+    'total',
+    'operatorCorrect',
+    'operatorTotal',
+    ])
+
+
+def percent(correct, total):
+    """Return correct/total as a whole percentage.
+    """
+
+    return correct * 100 // total if total else 0
+
+
+def _operatorIndexes(operators, weights=None):
+    """Return (OPERATORS indexes, weights) for the requested operator
+    symbols, both in OPERATORS order. Repeated symbols are dropped.
+    weights, if given, has one weight per requested operator; without
+    it every operator is drawn equally often and weights is None.
+    """
+
+    if operators and len(operators) > len(OPERATORS):
+        raise ValueError('At most %d operators can be given.' % len(
+            OPERATORS))
+    try:
+        indexes = [OPERATORS.index(op) for op in operators or OPERATORS]
+    except ValueError:
+        raise ValueError('Operators must be any of: %s' % ' '.join(OPERATORS))
+
+    if not weights:
+        return tuple(sorted(set(indexes))), None
+    if len(weights) != len(indexes) or len(set(indexes)) != len(indexes):
+        raise ValueError('Weights need one distinct operator each.')
+    if not all(0 < w <= MAX_WEIGHT for w in weights):
+        raise ValueError('Weights must be between 1 and %d.' % MAX_WEIGHT)
+    pairs = sorted(zip(indexes, weights))
+    return tuple(i for i, w in pairs), tuple(w for i, w in pairs)
+
+
+def _drawOperators(rng, count, opIndexes, weights):
+    """Return count operator indexes drawn from opIndexes, in proportion
+    to weights if given.
+    """
+
+    if not weights:
+        return array('b', [rng.choice(opIndexes) for _ in range(count)])
+
+    bounds = []
+    total = 0
+    for weight in weights:
+        total += weight
+        bounds.append(total)
+    return array('b', [opIndexes[bisect.bisect_right(
+        bounds, rng.randrange(total))] for _ in range(count)])
+
+
+def solve(integer1, integer2, operatorIndexes):
+    """Return the answers for parallel operand and operator arrays.
+    """
+
+    return array('l', [SOLVERS[o](a, b) for a, b, o in zip(
+        integer1, integer2, operatorIndexes)])
+
+
+def generateQuiz(count=None, operators=None, difficulty=None,
+        minValue=None, maxValue=None, seed=None, weights=None):
+    """Generate a reproducible set of problems.
+
+    Operand ranges come from the difficulty band unless minValue/maxValue
+    are given. Operators are drawn equally often unless weights, one per
+    operator, are given. Subtraction never goes negative and division
+    always divides evenly: the divisor and the answer are in the operand
+    range, so the dividend can exceed maxValue. Raises ValueError on
+    invalid parameters.
+    """
+
+    count = DEFAULT_COUNT if count is None else count
+    if not 0 < count <= MAX_COUNT:
+        raise ValueError('Count must be between 1 and %d.' % MAX_COUNT)
+
+    difficulty = difficulty or DEFAULT_DIFFICULTY
+    try:
+        lo, hi = DIFFICULTIES[difficulty]
+    except KeyError:
+        raise ValueError('Difficulty must be any of: %s' % ' '.join(
+            sorted(DIFFICULTIES)))
+    if minValue is not None:
+        lo = minValue
+    if maxValue is not None:
+        hi = maxValue
+    if not 0 <= lo <= hi <= MAX_VALUE:
+        raise ValueError('Operand range must satisfy 0 <= min <= max '
+            '<= %d.' % MAX_VALUE)
+
+    opIndexes, weights = _operatorIndexes(operators, weights)
+    if seed is None:
+        seed = random.SystemRandom().randint(1, MAX_SEED)
+    elif not 1 <= seed <= MAX_SEED:
+        raise ValueError('Seed must be between 1 and %d.' % MAX_SEED)
+    rng = random.Random(seed)
+
+    # Draw each column in a single pass
+    ops = _drawOperators(rng, count, opIndexes, weights)
+    integer1 = array('l', [rng.randint(lo, hi) for _ in range(count)])
+    integer2 = array('l', [rng.randint(lo, hi) for _ in range(count)])
+
+    # Fix up subtraction and division so every answer is a whole,
+    # non-negative number
+    for i, o in enumerate(ops):
+        a, b = integer1[i], integer2[i]
+        if OPERATORS[o] == '-' and a < b:
+            integer1[i], integer2[i] = b, a
+        elif OPERATORS[o] == '/':
+            b = b or 1
+            integer1[i], integer2[i] = a * b, b
+
+    return Quiz(
+        seed=seed,
+        difficulty=difficulty,
+        minValue=lo,
+        maxValue=hi,
+        operators=[OPERATORS[o] for o in opIndexes],
+        weights=list(weights) if weights else None,
+        integer1=integer1,
+        integer2=integer2,
+        operatorIndexes=ops,
+        answers=solve(integer1, integer2, ops))
+
+
+def gradeQuiz(quiz, answers):
+    """Grade a packed answer array against a generated quiz in one pass.
+
+    Missing trailing answers are marked wrong. Per-operator counters are
+    indexed like OPERATORS. Raises ValueError on too many answers.
+    """
+
+    total = len(quiz.answers)
+    if len(answers) > total:
+        raise ValueError('Got %d answers for %d problems.' % (
+            len(answers), total))
+
+    marks = array('b', [int(a == b) for a, b in zip(quiz.answers, answers)])
+    marks.extend([0] * (total - len(marks)))
+
+    operatorCorrect = [0] * len(OPERATORS)
+    operatorTotal = [0] * len(OPERATORS)
+    for o, mark in zip(quiz.operatorIndexes, marks):
+        operatorTotal[o] += 1
+        operatorCorrect[o] += mark
+
+    return Grade(
+        marks=marks,
+        correct=sum(marks),
+        total=total,
+        operatorCorrect=operatorCorrect,
+        operatorTotal=operatorTotal)
@@ -0,0 +1,215 @@
+"""rollups.py
+
+Incrementally maintained class report rollups.
+
+Each teacher's Profile has one ClassReport child holding histograms of
+its students' running scores: one bucket per whole percent for the
+overall score (enough for exact percentiles), and decile buckets of
+each student's accuracy per operator. Every graded attempt moves the
+student from their old buckets to their new ones, so a report is read
+from one entity whatever the class size.
+
+Attempts are not applied in the grading transaction, which only
+touches the student's own entity group. It adds a task holding the
+student's totals before and after the attempt to the report-updates
+pull queue, transactionally; the flush worker leases the queued
+updates and applies each class's in one transaction, so a class's
+report takes one write per flush however many students submit at
+once. Moves add up in any order, and the names of the tasks applied
+last are kept on the report, so a redelivered update is applied once.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import json
+import logging
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+import namedtasks
+from models import ClassReport
+import quizgen
+
+REPORT_ID = 'report'
+PERCENT_BUCKETS = 101
+OPERATOR_BUCKETS = 11
+
+UPDATES_QUEUE = 'report-updates'
+FLUSH_WINDOW = 10
+FLUSH_URL = '/tasks/flush_report_updates'
+LEASE_SECONDS = 300
+MAX_TASKS = 1000
+APPLIED_TASKS = 2 * MAX_TASKS
+
+# Errors raised reading an update that can never be applied
+UNREADABLE = (ValueError, TypeError, KeyError, ProtocolBufferDecodeError)
+
+
+def reportKey(p_key):
+    """Return the ClassReport key for a teacher's Profile key.
+    """
+
+    return ndb.Key(ClassReport, REPORT_ID, parent=p_key)
+
+
+def newReport(p_key):
+    """Return an empty ClassReport for a teacher's Profile key.
+    """
+
+    size = len(quizgen.OPERATORS)
+    return ClassReport(
+        key=reportKey(p_key),
+        students=0,
+        percentSum=0,
+        percentHistogram=[0] * PERCENT_BUCKETS,
+        operatorCorrect=[0] * size,
+        operatorTotal=[0] * size,
+        operatorHistogram=[0] * (size * OPERATOR_BUCKETS),
+        appliedTasks=[])
+
+
+def snapshot(student):
+    """Return the parts of a Student's totals a ClassReport depends on.
+    """
+
+    return (student.total, student.percent,
+        list(student.operatorCorrect), list(student.operatorTotal))
+
+
+def _operatorBuckets(operatorCorrect, operatorTotal):
+    """Return the operatorHistogram index for each operator attempted.
+    """
+
+    return [o * OPERATOR_BUCKETS + quizgen.percent(c, t) // 10 \
+        for o, (c, t) in enumerate(zip(operatorCorrect, operatorTotal)) \
+        if t]
+
+
+def applyAttempt(report, before, after):
+    """Move a student's contribution to the report from their totals
+    before an attempt to their totals after it (both snapshot()s).
+    """
+
+    total, percent, operatorCorrect, operatorTotal = before
+    newTotal, newPercent, newCorrect, newOperatorTotal = after
+
+    # Take out the student's previous contribution, if any
+    if total:
+        report.students -= 1
+        report.percentSum -= percent
+        report.percentHistogram[percent] -= 1
+        for i in _operatorBuckets(operatorCorrect, operatorTotal):
+            report.operatorHistogram[i] -= 1
+
+    # Add the current one
+    report.students += 1
+    report.percentSum += newPercent
+    report.percentHistogram[newPercent] += 1
+    for i in _operatorBuckets(newCorrect, newOperatorTotal):
+        report.operatorHistogram[i] += 1
+
+    # Class-wide per-operator totals only grow by this attempt
+    report.operatorCorrect = [r + a - b for r, a, b in zip(
+        report.operatorCorrect, newCorrect,
+        operatorCorrect or [0] * len(newCorrect))]
+    report.operatorTotal = [r + a - b for r, a, b in zip(
+        report.operatorTotal, newOperatorTotal,
+        operatorTotal or [0] * len(newOperatorTotal))]
+
+
+def enqueueAttempt(p_key, before, student):
+    """Queue the move of a student within the teacher's report, from
+    their totals before an attempt (a snapshot()) to their current ones.
+    Call in the transaction storing the attempt.
+    """
+
+    taskqueue.Queue(UPDATES_QUEUE).add(taskqueue.Task(
+        payload=json.dumps({
+            'teacher': p_key.urlsafe(),
+            'before': before,
+            'after': snapshot(student),
+            }),
+        method='PULL'), transactional=True)
+    ndb.get_context().call_on_commit(lambda: namedtasks.scheduleFlush(
+        'reports', FLUSH_URL, FLUSH_WINDOW))
+
+
+@ndb.transactional()
+def _applyUpdates(p_key, updates):
+    """Apply [(task name, before, after)] updates not applied yet to the
+    teacher's report.
+    """
+
+    report = reportKey(p_key).get() or newReport(p_key)
+    applied = set(report.appliedTasks)
+    names = []
+    for name, before, after in updates:
+        if name not in applied:
+            applyAttempt(report, before, after)
+            names.append(name)
+    report.appliedTasks = (report.appliedTasks + names)[-APPLIED_TASKS:]
+    report.put()
+
+
+def flush():
+    """Lease the queued report updates and apply them, one transaction
+    per class. Returns the number of updates applied.
+    """
+
+    queue = taskqueue.Queue(UPDATES_QUEUE)
+    applied = 0
+    while True:
+        tasks = queue.lease_tasks(LEASE_SECONDS, MAX_TASKS)
+        if not tasks:
+            break
+
+        updatesByClass = {}
+        done = []
+        for task in tasks:
+            try:
+                payload = json.loads(task.payload)
+                updatesByClass.setdefault(
+                    ndb.Key(urlsafe=payload['teacher']), []).append(
+                    (task.name, payload['before'], payload['after']))
+            except UNREADABLE:
+                logging.exception('Deleting unreadable report update %s',
+                    task.name)
+            done.append(task)
+
+        retry = False
+        for p_key, updates in updatesByClass.items():
+            try:
+                _applyUpdates(p_key, updates)
+                applied += len(updates)
+            except Exception:
+                # Leave the class's updates to be leased again
+                logging.exception('Could not update the report of %s',
+                    p_key)
+                names = set(name for name, before, after in updates)
+                done = [task for task in done if task.name not in names]
+                retry = True
+        if done:
+            queue.delete_tasks(done)
+        if retry:
+            namedtasks.scheduleFlush('reports-retry', FLUSH_URL,
+                FLUSH_WINDOW, LEASE_SECONDS)
+            break
+    return applied
+
+
+def percentile(report, p):
+    """Return the p-th percentile of the students' percent scores.
+    """
+
+    if not report.students:
+        return 0
+    rank = max(1, -(-report.students * p // 100))
+    seen = 0
+    for percent, count in enumerate(report.percentHistogram):
+        seen += count
+        if seen >= rank:
+            return percent
+    return PERCENT_BUCKETS - 1
@@ -0,0 +1,28 @@
+"""Unit tests for the MathQuizer modules.
+
+Run from the repository root with python -m unittest discover tests (or
+pytest). Modules that import the App Engine SDK are tested only when it
+is installed; see sdkModule.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import importlib
+
+
+def sdkModule(name):
+    """Return the named module, putting the App Engine SDK on sys.path if
+    it is not there yet, or None if the SDK is not installed.
+    """
+
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        pass
+    import localstubs
+    try:
+        localstubs.setupSdkPath()
+        return importlib.import_module(name)
+    except ImportError:
+        return None
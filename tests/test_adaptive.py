@@ -0,0 +1,80 @@
+"""Tests for adaptive."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import unittest
+
+import quizgen
+from tests import sdkModule
+
+adaptive = sdkModule('adaptive')
+
+
+@unittest.skipIf(adaptive is None, 'App Engine SDK not installed')
+class FoldQuizTest(unittest.TestCase):
+
+    def _estimates(self, stats, operator, difficulty):
+        return adaptive._estimates(stats, adaptive._cell(
+            quizgen.OPERATORS.index(operator),
+            adaptive.LEVELS.index(difficulty)))
+
+    def testDecay(self):
+        stats = adaptive.newStats()
+        quiz = quizgen.generateQuiz(count=2, operators=['+'], seed=1)
+        adaptive.foldQuiz(stats, quiz, [1, 0], [1000, 3000])
+        accuracy, millis, answers = self._estimates(stats, '+', 'EASY')
+        self.assertAlmostEqual(1.9, answers, places=5)
+        self.assertAlmostEqual(0.9 / 1.9, accuracy, places=5)
+        self.assertAlmostEqual(3900 / 1.9, millis, places=2)
+
+        # Missing times count as 0; older answers weigh less each time
+        adaptive.foldQuiz(stats, quiz, [1, 1], [])
+        accuracy, millis, answers = self._estimates(stats, '+', 'EASY')
+        self.assertAlmostEqual(3.439, answers, places=5)
+        self.assertAlmostEqual(2.629 / 3.439, accuracy, places=5)
+        self.assertAlmostEqual(3159 / 3.439, millis, places=2)
+
+    def testCellsByOperatorAndBand(self):
+        stats = adaptive.newStats()
+        quiz = quizgen.generateQuiz(count=1, operators=['*'],
+            difficulty='HARD', seed=1)
+        adaptive.foldQuiz(stats, quiz, [1], [500])
+        self.assertEqual(1, self._estimates(stats, '*', 'HARD')[2])
+        self.assertEqual(3, len([v for v in stats if v]))
+        self.assertEqual(0, self._estimates(stats, '*', 'EASY')[2])
+
+
+@unittest.skipIf(adaptive is None, 'App Engine SDK not installed')
+class NextQuizParametersTest(unittest.TestCase):
+
+    def _answer(self, stats, operator, correct, millis=1000):
+        quiz = quizgen.generateQuiz(count=20, operators=[operator], seed=1)
+        adaptive.foldQuiz(stats, quiz, [correct] * 20, [millis] * 20)
+
+    def testNewStudent(self):
+        difficulty, operators, weights = adaptive.nextQuizParameters(
+            adaptive.newStats())
+        self.assertEqual('EASY', difficulty)
+        self.assertEqual(list(quizgen.OPERATORS), operators)
+        self.assertEqual([adaptive.MAX_WEIGHT - 1] * 4, weights)
+
+    def testPromotedWhenEveryOperatorIsMastered(self):
+        stats = adaptive.newStats()
+        for operator in quizgen.OPERATORS:
+            self._answer(stats, operator, 1)
+        self.assertEqual('MEDIUM', adaptive.nextQuizParameters(stats)[0])
+
+    def testWeakAndSlowOperatorsWeighMore(self):
+        stats = adaptive.newStats()
+        self._answer(stats, '+', 1)
+        self._answer(stats, '-', 1)
+        self._answer(stats, '*', 1, millis=2 * adaptive.SLOW_MILLIS)
+        self._answer(stats, '/', 0)
+        difficulty, operators, weights = adaptive.nextQuizParameters(stats)
+        self.assertEqual('EASY', difficulty)
+        self.assertEqual([1, 1, 2, adaptive.MAX_WEIGHT - 1], weights)
+        quizgen.generateQuiz(operators=operators, weights=weights, seed=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Tests for answerlog, on the local service stubs."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import time
+import unittest
+
+import quizgen
+from tests import sdkModule
+
+answerlog = sdkModule('answerlog')
+
+
+@unittest.skipIf(answerlog is None, 'App Engine SDK not installed')
+class FlushTest(unittest.TestCase):
+
+    def setUp(self):
+        import localstubs
+        from google.appengine.ext import ndb
+
+        self.bed = localstubs.activate()
+        self.leaseSeconds = answerlog.LEASE_SECONDS
+        answerlog.LEASE_SECONDS = 1
+        self.owner = ndb.Key('Profile', 'user@example.com')
+        self.quiz = quizgen.generateQuiz(count=3, seed=5)
+
+    def tearDown(self):
+        answerlog.LEASE_SECONDS = self.leaseSeconds
+        self.bed.deactivate()
+
+    def _answer(self, eventId, index, attemptId='first'):
+        answerlog.enqueueAnswer(self.owner, 'user@example.com', self.quiz,
+            attemptId, eventId, index, self.quiz.answers[index], True, 100)
+
+    def _attempt(self, attemptId='first'):
+        return answerlog.attemptKey(self.owner, self.quiz, attemptId).get(
+            use_cache=False, use_memcache=False)
+
+    def _waitForLeases(self):
+        time.sleep(answerlog.LEASE_SECONDS + 0.5)
+
+    def testFailedMergeIsRedelivered(self):
+        self._answer('e1', 0)
+        self._answer('e2', 1)
+        self._answer('e1', 0)
+
+        merge = answerlog._mergeGroup
+        def failingMerge(eventsByKey):
+            raise RuntimeError('datastore unavailable')
+        answerlog._mergeGroup = failingMerge
+        try:
+            self.assertEqual(0, answerlog.flush())
+        finally:
+            answerlog._mergeGroup = merge
+        self.assertEqual(None, self._attempt())
+
+        self._waitForLeases()
+        self.assertEqual(3, answerlog.flush())
+        attempt = self._attempt()
+        self.assertEqual(2, attempt.answered)
+        self.assertEqual(2, attempt.correct)
+        self.assertEqual(set(['e1', 'e2']), set(attempt.events))
+        self.assertEqual(0, answerlog.flush())
+
+    def testWrittenEventsRedeliveredAreStoredOnce(self):
+        from google.appengine.api import taskqueue
+
+        self._answer('e1', 0)
+        self._answer('e2', 1)
+
+        # The events are written but their tasks are not deleted
+        deleteTasks = taskqueue.Queue.delete_tasks
+        def failingDelete(queue, tasks):
+            raise taskqueue.TransientError()
+        taskqueue.Queue.delete_tasks = failingDelete
+        try:
+            self.assertRaises(taskqueue.TransientError, answerlog.flush)
+        finally:
+            taskqueue.Queue.delete_tasks = deleteTasks
+        self.assertEqual(2, self._attempt().answered)
+
+        self._waitForLeases()
+        self._answer('e3', 2)
+        self.assertEqual(3, answerlog.flush())
+        attempt = self._attempt()
+        self.assertEqual(3, attempt.answered)
+        self.assertEqual(set(['e1', 'e2', 'e3']), set(attempt.events))
+
+    def testRetakesAreStoredApart(self):
+        self._answer('e1', 0)
+        self._answer('e1', 0, attemptId='second')
+        self.assertEqual(2, answerlog.flush())
+        self.assertEqual(1, self._attempt().answered)
+        self.assertEqual(1, self._attempt('second').answered)
+
+    def testUnreadableEventsAreDeleted(self):
+        from google.appengine.api import taskqueue
+
+        queue = taskqueue.Queue(answerlog.EVENTS_QUEUE)
+        queue.add(taskqueue.Task(payload='not json', method='PULL'))
+        queue.add(taskqueue.Task(payload='{"attempt": "bad"}',
+            method='PULL'))
+        self._answer('e1', 0)
+        self.assertEqual(1, answerlog.flush())
+        self.assertEqual(1, self._attempt().answered)
+
+        self._waitForLeases()
+        self.assertEqual([], queue.lease_tasks(60, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
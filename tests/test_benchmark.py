@@ -0,0 +1,72 @@
+"""Tests for the benchmark scenarios, on the local service stubs."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import unittest
+
+import benchmark
+from tests import sdkModule
+
+quizer = sdkModule('quizer')
+
+
+class PercentileTest(unittest.TestCase):
+
+    def testNearestRank(self):
+        timings = [i / 100.0 for i in range(1, 101)]
+        self.assertEqual(0.5, benchmark.percentile(timings, 50))
+        self.assertEqual(0.99, benchmark.percentile(timings, 99))
+        self.assertEqual(0.01, benchmark.percentile([0.01], 99))
+
+
+@unittest.skipIf(quizer is None, 'App Engine SDK not installed')
+class ScenarioTest(unittest.TestCase):
+
+    def testEveryScenarioRuns(self):
+        for name in benchmark.SCENARIOS:
+            throughput, p50, p99 = benchmark.run(name, 5, 3, 1.0)
+            self.assertTrue(throughput > 0, name)
+            self.assertTrue(p50 <= p99, name)
+
+
+@unittest.skipIf(quizer is None, 'App Engine SDK not installed')
+class ConferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        import localstubs
+
+        self.bed = localstubs.activate()
+        self.api = quizer.QuizerApi()
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def testQueryByCity(self):
+        from models import QueryForm
+        from models import QueryForms
+
+        benchmark._createConferences(self.api, 10)
+        forms = self.api.queryConferences(QueryForms(filters=[QueryForm(
+            field='CITY', operator='EQ', value='Paris')]))
+        self.assertEqual(['Conference 1', 'Conference 6'],
+            sorted(form.name for form in forms.items))
+
+    def testRegistrationTakesOneSeatPerUser(self):
+        import capacity
+        import localstubs
+        from google.appengine.ext import ndb
+
+        wsck = benchmark._createConferences(self.api, 1)[0]
+        request = quizer.CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck)
+        for i in range(3):
+            localstubs.signIn('user%d@example.com' % i)
+            self.assertTrue(self.api.registerForConference(request).data)
+        self.assertRaises(quizer.ConflictException,
+            self.api.registerForConference, request)
+        self.assertEqual(1000000 - 3,
+            capacity.countSeats(ndb.Key(urlsafe=wsck)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tests for bundles."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import hashlib
+import json
+import unittest
+
+import quizgen
+from tests import sdkModule
+
+bundles = sdkModule('bundles')
+
+
+@unittest.skipIf(bundles is None, 'App Engine SDK not installed')
+class BundlesTest(unittest.TestCase):
+
+    def setUp(self):
+        # A known secret, so no Secret entity is read
+        bundles._secret[:] = [b'k' * 32]
+        self.quiz = quizgen.generateQuiz(count=5, operators=['+', '/'],
+            weights=[3, 1], difficulty='MEDIUM', seed=1234)
+
+    def tearDown(self):
+        del bundles._secret[:]
+
+    def testAnswerHash(self):
+        self.assertEqual(
+            hashlib.sha256(b'abc:2:17').hexdigest()[:bundles.HASH_LENGTH],
+            bundles.answerHash('abc', 2, 17))
+        self.assertNotEqual(bundles.answerHash('abc', 2, 17),
+            bundles.answerHash('abd', 2, 17))
+
+    def testRoundTrip(self):
+        token, nonce, expires, hashes = bundles.makeBundle(
+            self.quiz, 'owner')
+        self.assertEqual([bundles.answerHash(nonce, i, a) \
+            for i, a in enumerate(self.quiz.answers)], hashes)
+
+        bundle = bundles.readBundle(token)
+        self.assertEqual('owner', bundle['owner'])
+        self.assertEqual(nonce, bundle['nonce'])
+        self.assertEqual(self.quiz, quizgen.generateQuiz(
+            count=bundle['count'],
+            operators=bundle['operators'],
+            difficulty=bundle['difficulty'],
+            minValue=bundle['minValue'],
+            maxValue=bundle['maxValue'],
+            seed=bundle['seed'],
+            weights=bundle['weights']))
+
+    def testNoncesDiffer(self):
+        self.assertNotEqual(bundles.makeBundle(self.quiz, 'owner')[1],
+            bundles.makeBundle(self.quiz, 'owner')[1])
+
+    def testForgedToken(self):
+        token = bundles.makeBundle(self.quiz, 'owner')[0]
+        payload, signature = token.split('.')
+        data = json.loads(bundles._b64decode(payload).decode('utf-8'))
+        data['o'] = 'someone else'
+        forged = bundles._b64encode(json.dumps(data).encode('utf-8'))
+        self.assertRaises(bundles.InvalidBundleError, bundles.readBundle,
+            '%s.%s' % (forged, signature))
+
+        bundles._secret[:] = [b'x' * 32]
+        self.assertRaises(bundles.InvalidBundleError, bundles.readBundle,
+            token)
+
+    def testMalformedToken(self):
+        for token in (None, '', 'abc', 'a.b.c', '!!.??'):
+            self.assertRaises(bundles.InvalidBundleError,
+                bundles.readBundle, token)
+
+    def testExpiredToken(self):
+        payload = json.dumps({'q': [1, 'EASY', 0, 10, '+', 1, None],
+            'o': 'owner', 'n': 'nonce', 'e': 1}).encode('utf-8')
+        token = '%s.%s' % (bundles._b64encode(payload),
+            bundles._b64encode(bundles._sign(payload)))
+        self.assertRaises(bundles.InvalidBundleError, bundles.readBundle,
+            token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Tests for queryplan."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import logging
+import unittest
+
+import queryplan
+
+
+def _filter(field, operator='='):
+    return {'field': field, 'operator': operator}
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.required = set(queryplan.requiredIndexes())
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def testEqualitiesMergeOneIndexPerField(self):
+        plan = queryplan.plan('Conference', None,
+            [_filter('topics'), _filter('city')], self.required)
+        self.assertEqual(['name'], plan.orders)
+        self.assertEqual([('city', 'name'), ('topics', 'name')],
+            plan.indexes)
+        self.assertFalse(plan.rewritten)
+
+    def testInequalityNeedsOneCompositeIndex(self):
+        plan = queryplan.plan('Conference', 'maxAttendees',
+            [_filter('month'), _filter('city'),
+            _filter('maxAttendees', '>')], self.required)
+        self.assertEqual(['maxAttendees', 'name'], plan.orders)
+        self.assertEqual([('city', 'month', 'maxAttendees', 'name')],
+            plan.indexes)
+
+    def testNoFiltersNeedNoIndex(self):
+        plan = queryplan.plan('Conference', None, [], set())
+        self.assertEqual(['name'], plan.orders)
+        self.assertEqual([], plan.indexes)
+
+    def testUnreadableIndexFileSkipsChecks(self):
+        queryplan._declared[:] = [None]
+        try:
+            plan = queryplan.plan('Conference', 'maxAttendees',
+                [_filter('city'), _filter('maxAttendees', '<')])
+        finally:
+            del queryplan._declared[:]
+        self.assertFalse(plan.rewritten)
+        self.assertEqual([('city', 'maxAttendees', 'name')], plan.indexes)
+
+    def testRewrittenWithoutNameSort(self):
+        declared = set([('Conference', ('city', 'maxAttendees'))])
+        plan = queryplan.plan('Conference', 'maxAttendees',
+            [_filter('city'), _filter('maxAttendees', '>=')], declared)
+        self.assertTrue(plan.rewritten)
+        self.assertEqual(['maxAttendees'], plan.orders)
+        self.assertEqual([('city', 'maxAttendees')], plan.indexes)
+        self.assertEqual([('city', 'maxAttendees', 'name')], plan.missing)
+
+    def testRejectedWithoutAnyIndex(self):
+        self.assertRaises(queryplan.QueryPlanError, queryplan.plan,
+            'Conference', 'maxAttendees',
+            [_filter('city'), _filter('maxAttendees', '<')], set())
+
+    def testRepeatedFieldTwiceWithInequality(self):
+        self.assertRaises(queryplan.QueryPlanError, queryplan.plan,
+            'Conference', 'month', [_filter('topics'), _filter('topics'),
+            _filter('month', '>')], self.required)
+        plan = queryplan.plan('Conference', None,
+            [_filter('topics'), _filter('topics')], self.required)
+        self.assertEqual([('topics', 'name')], plan.indexes)
+
+
+class RequiredIndexesTest(unittest.TestCase):
+
+    def testEveryQueryIsCovered(self):
+        required = set(queryplan.requiredIndexes())
+        for kind, (fields, repeated, sortField) in queryplan.SPACES.items():
+            names = sorted(fields.values())
+            for inequality in [None] + names:
+                filters = [_filter(name) for name in names \
+                    if name != inequality]
+                if inequality:
+                    filters.append(_filter(inequality, '>'))
+                plan = queryplan.plan(kind, inequality, filters, required)
+                self.assertFalse(plan.rewritten)
+
+    def testStableAndUnique(self):
+        required = queryplan.requiredIndexes()
+        self.assertEqual(required, queryplan.requiredIndexes())
+        self.assertEqual(len(set(required)), len(required))
+
+    def testIndexYaml(self):
+        lines = queryplan.indexYaml().splitlines()
+        self.assertEqual(['- kind: Conference', '  properties:',
+            '  - name: city', '  - name: name', ''], lines[:5])
+        self.assertEqual(len(queryplan.requiredIndexes()),
+            lines.count('  properties:'))
+
+
+if __name__ == '__main__':
+    unittest.main()
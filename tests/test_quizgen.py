@@ -0,0 +1,134 @@
+"""Tests for quizgen."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import unittest
+
+import quizgen
+
+
+class GenerateQuizTest(unittest.TestCase):
+
+    def testSameSeedSameQuiz(self):
+        a = quizgen.generateQuiz(count=50, difficulty='MEDIUM', seed=42)
+        b = quizgen.generateQuiz(count=50, difficulty='MEDIUM', seed=42)
+        self.assertEqual(a, b)
+
+    def testOtherParametersOtherQuiz(self):
+        a = quizgen.generateQuiz(count=50, seed=42)
+        self.assertNotEqual(a, quizgen.generateQuiz(count=50, seed=43))
+        self.assertNotEqual(a.integer1, quizgen.generateQuiz(
+            count=50, difficulty='HARD', seed=42).integer1)
+
+    def testRandomSeedIsReturned(self):
+        quiz = quizgen.generateQuiz()
+        self.assertTrue(1 <= quiz.seed <= quizgen.MAX_SEED)
+        self.assertEqual(quiz, quizgen.generateQuiz(seed=quiz.seed))
+
+    def testSeedOutOfRange(self):
+        for seed in (0, -1, quizgen.MAX_SEED + 1):
+            self.assertRaises(ValueError, quizgen.generateQuiz, seed=seed)
+        self.assertEqual(quizgen.MAX_SEED,
+            quizgen.generateQuiz(seed=quizgen.MAX_SEED).seed)
+
+    def testDefaults(self):
+        quiz = quizgen.generateQuiz(seed=1)
+        self.assertEqual(quizgen.DEFAULT_COUNT, len(quiz.answers))
+        self.assertEqual(quizgen.DEFAULT_DIFFICULTY, quiz.difficulty)
+        self.assertEqual(list(quizgen.OPERATORS), quiz.operators)
+        self.assertEqual(None, quiz.weights)
+
+    def testInvalidParameters(self):
+        for kwargs in ({'count': 0}, {'count': quizgen.MAX_COUNT + 1},
+                {'difficulty': 'IMPOSSIBLE'},
+                {'minValue': 5, 'maxValue': 4}, {'minValue': -1}):
+            self.assertRaises(ValueError, quizgen.generateQuiz, **kwargs)
+
+    def testAnswersAreWholeAndNonNegative(self):
+        quiz = quizgen.generateQuiz(count=quizgen.MAX_COUNT,
+            difficulty='HARD', seed=7)
+        for a, b, o, answer in zip(quiz.integer1, quiz.integer2,
+                quiz.operatorIndexes, quiz.answers):
+            self.assertTrue(answer >= 0)
+            if quizgen.OPERATORS[o] == '/':
+                self.assertEqual(a, answer * b)
+            self.assertTrue(0 <= min(a, b))
+
+    def testOperandCap(self):
+        self.assertRaises(ValueError, quizgen.generateQuiz,
+            maxValue=quizgen.MAX_VALUE + 1)
+        self.assertRaises(ValueError, quizgen.generateQuiz,
+            count=5, operators=['*'], maxValue=2 ** 40, seed=1)
+        quiz = quizgen.generateQuiz(count=quizgen.MAX_COUNT,
+            operators=['*', '/'], minValue=quizgen.MAX_VALUE,
+            maxValue=quizgen.MAX_VALUE, seed=1)
+        self.assertEqual(quizgen.MAX_VALUE ** 2, max(quiz.answers))
+        self.assertEqual(quizgen.MAX_VALUE ** 2, max(quiz.integer1))
+
+    def testOperandRange(self):
+        quiz = quizgen.generateQuiz(count=quizgen.MAX_COUNT,
+            operators=['+'], minValue=20, maxValue=30, seed=3)
+        self.assertTrue(all(20 <= n <= 30 for n in quiz.integer1))
+        self.assertTrue(all(20 <= n <= 30 for n in quiz.integer2))
+
+
+class OperatorSelectionTest(unittest.TestCase):
+
+    def testOnlyRequestedOperators(self):
+        quiz = quizgen.generateQuiz(count=quizgen.MAX_COUNT,
+            operators=['*', '-'], seed=5)
+        self.assertEqual(['-', '*'], quiz.operators)
+        self.assertEqual(set([1, 2]), set(quiz.operatorIndexes))
+
+    def testRepeatedOperatorsAreDropped(self):
+        self.assertEqual(
+            quizgen.generateQuiz(operators=['+'], seed=9),
+            quizgen.generateQuiz(operators=['+', '+'], seed=9))
+
+    def testUnknownOrTooManyOperators(self):
+        self.assertRaises(ValueError, quizgen.generateQuiz,
+            operators=['%'])
+        self.assertRaises(ValueError, quizgen.generateQuiz,
+            operators=['+'] * (len(quizgen.OPERATORS) + 1))
+
+    def testWeights(self):
+        quiz = quizgen.generateQuiz(count=quizgen.MAX_COUNT,
+            operators=['/', '+'], weights=[1, 99], seed=11)
+        self.assertEqual(['+', '/'], quiz.operators)
+        self.assertEqual([99, 1], quiz.weights)
+        counts = [list(quiz.operatorIndexes).count(o) for o in (0, 3)]
+        self.assertTrue(counts[0] > counts[1])
+        self.assertEqual(quizgen.MAX_COUNT, sum(counts))
+
+    def testInvalidWeights(self):
+        for operators, weights in ((['+', '-'], [1]),
+                (['+', '+'], [1, 2]), (['+'], [0]),
+                (['+'], [quizgen.MAX_WEIGHT + 1])):
+            self.assertRaises(ValueError, quizgen.generateQuiz,
+                operators=operators, weights=weights)
+
+
+class GradeQuizTest(unittest.TestCase):
+
+    def testGrade(self):
+        quiz = quizgen.generateQuiz(count=4, seed=21)
+        answers = list(quiz.answers)
+        answers[1] += 1
+        grade = quizgen.gradeQuiz(quiz, answers[:3])
+        self.assertEqual([1, 0, 1, 0], list(grade.marks))
+        self.assertEqual(2, grade.correct)
+        self.assertEqual(4, grade.total)
+        self.assertEqual(4, sum(grade.operatorTotal))
+        self.assertEqual(2, sum(grade.operatorCorrect))
+
+    def testTooManyAnswers(self):
+        quiz = quizgen.generateQuiz(count=2, seed=1)
+        self.assertRaises(ValueError, quizgen.gradeQuiz, quiz, [0, 0, 0])
+
+    def testPercent(self):
+        self.assertEqual(66, quizgen.percent(2, 3))
+        self.assertEqual(0, quizgen.percent(0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
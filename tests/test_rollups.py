@@ -0,0 +1,144 @@
+"""Tests for rollups."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import unittest
+
+from tests import sdkModule
+
+rollups = sdkModule('rollups')
+
+
+@unittest.skipIf(rollups is None, 'App Engine SDK not installed')
+class RollupsTest(unittest.TestCase):
+
+    def setUp(self):
+        from google.appengine.ext import ndb
+        from google.appengine.ext import testbed
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.report = rollups.newReport(ndb.Key('Profile', 'teacher'))
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _grade(self, student, correct, total, operatorCorrect,
+            operatorTotal):
+        """Record an attempt on student and apply it to the report.
+        """
+
+        before = rollups.snapshot(student)
+        student.correct += correct
+        student.total += total
+        student.percent = student.correct * 100 // student.total
+        student.operatorCorrect = [a + b for a, b in zip(
+            student.operatorCorrect or [0] * 4, operatorCorrect)]
+        student.operatorTotal = [a + b for a, b in zip(
+            student.operatorTotal or [0] * 4, operatorTotal)]
+        rollups.applyAttempt(self.report, before,
+            rollups.snapshot(student))
+
+    def _student(self):
+        from models import Student
+        return Student(correct=0, total=0, percent=0)
+
+    def testFirstAttemptAddsStudent(self):
+        student = self._student()
+        self._grade(student, 3, 4, [2, 1, 0, 0], [2, 2, 0, 0])
+        self.assertEqual(1, self.report.students)
+        self.assertEqual(75, self.report.percentSum)
+        self.assertEqual(1, self.report.percentHistogram[75])
+        self.assertEqual([2, 1, 0, 0], self.report.operatorCorrect)
+        self.assertEqual([2, 2, 0, 0], self.report.operatorTotal)
+
+        # '+' at 100% and '-' at 50%; '*' and '/' not attempted
+        buckets = rollups.OPERATOR_BUCKETS
+        self.assertEqual(1, self.report.operatorHistogram[10])
+        self.assertEqual(1, self.report.operatorHistogram[buckets + 5])
+        self.assertEqual(2, sum(self.report.operatorHistogram))
+
+    def testLaterAttemptMovesStudent(self):
+        student = self._student()
+        self._grade(student, 3, 4, [2, 1, 0, 0], [2, 2, 0, 0])
+        self._grade(student, 0, 4, [0, 0, 0, 0], [0, 2, 2, 0])
+        self.assertEqual(1, self.report.students)
+        self.assertEqual(37, self.report.percentSum)
+        self.assertEqual(0, self.report.percentHistogram[75])
+        self.assertEqual(1, self.report.percentHistogram[37])
+        self.assertEqual(sum(self.report.percentHistogram),
+            self.report.students)
+        self.assertEqual([2, 1, 0, 0], self.report.operatorCorrect)
+        self.assertEqual([2, 4, 2, 0], self.report.operatorTotal)
+        self.assertEqual(3, sum(self.report.operatorHistogram))
+
+    def testPercentile(self):
+        self.assertEqual(0, rollups.percentile(self.report, 50))
+        for correct in (1, 2, 3, 4):
+            self._grade(self._student(), correct, 4, [correct, 0, 0, 0],
+                [4, 0, 0, 0])
+        self.assertEqual(25, rollups.percentile(self.report, 0))
+        self.assertEqual(25, rollups.percentile(self.report, 25))
+        self.assertEqual(50, rollups.percentile(self.report, 50))
+        self.assertEqual(75, rollups.percentile(self.report, 51))
+        self.assertEqual(100, rollups.percentile(self.report, 100))
+
+
+
+@unittest.skipIf(rollups is None, 'App Engine SDK not installed')
+class FlushTest(unittest.TestCase):
+
+    def setUp(self):
+        import localstubs
+        from google.appengine.ext import ndb
+
+        self.bed = localstubs.activate()
+        self.p_key = ndb.Key('Profile', 'teacher@example.com')
+
+    def tearDown(self):
+        self.bed.deactivate()
+
+    def _report(self):
+        return rollups.reportKey(self.p_key).get(
+            use_cache=False, use_memcache=False)
+
+    def testQueuedAttemptsAreApplied(self):
+        from google.appengine.ext import ndb
+        from models import Student
+
+        students = [Student(teacher=self.p_key, correct=0, total=0,
+            percent=0) for _ in range(3)]
+        for correct, student in enumerate(students):
+            @ndb.transactional()
+            def grade():
+                before = rollups.snapshot(student)
+                student.correct, student.total = correct, 2
+                student.percent = correct * 50
+                student.operatorCorrect = [correct, 0, 0, 0]
+                student.operatorTotal = [2, 0, 0, 0]
+                student.put()
+                rollups.enqueueAttempt(self.p_key, before, student)
+            grade()
+        self.assertEqual(None, self._report())
+
+        self.assertEqual(3, rollups.flush())
+        report = self._report()
+        self.assertEqual(3, report.students)
+        self.assertEqual(150, report.percentSum)
+        self.assertEqual([3, 0, 0, 0], report.operatorCorrect)
+        self.assertEqual(50, rollups.percentile(report, 50))
+        self.assertEqual(0, rollups.flush())
+
+    def testRedeliveredUpdateIsAppliedOnce(self):
+        update = ('task-1', (0, 0, [], []), (2, 100, [2, 0, 0, 0],
+            [2, 0, 0, 0]))
+        rollups._applyUpdates(self.p_key, [update])
+        rollups._applyUpdates(self.p_key, [update, ('task-2',
+            update[2], (4, 50, [2, 0, 0, 0], [4, 0, 0, 0]))])
+        report = self._report()
+        self.assertEqual(1, report.students)
+        self.assertEqual(50, report.percentSum)
+        self.assertEqual(['task-1', 'task-2'], report.appliedTasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
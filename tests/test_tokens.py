@@ -0,0 +1,174 @@
+"""Tests for tokens, against a local tokeninfo and certs service."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import base64
+import binascii
+import json
+import threading
+import time
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+from tests import sdkModule
+
+tokens = sdkModule('tokens')
+
+try:
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Signature import PKCS1_v1_5
+except ImportError:
+    RSA = None
+
+
+class _Service(object):
+    """Responses and request counts of the local service."""
+
+    certs = (200, {'keys': []})
+    accessTokens = {}
+    requests = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        _Service.requests.append(url.path)
+        if url.path == '/certs':
+            status, body = _Service.certs
+        else:
+            token = parse_qs(url.query).get('access_token', [None])[0]
+            if token in _Service.accessTokens:
+                status, body = 200, _Service.accessTokens[token]
+            else:
+                status, body = 400, {'error': 'invalid_token'}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _jwk(key, kid):
+    def encode(n):
+        data = '%x' % n
+        return _b64encode(binascii.unhexlify('0' * (len(data) % 2) + data))
+    return {'kty': 'RSA', 'kid': kid, 'n': encode(key.n),
+        'e': encode(key.e)}
+
+
+@unittest.skipIf(tokens is None, 'App Engine SDK not installed')
+class TokensTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.base = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        cls.key = RSA.generate(1024) if RSA else None
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        from google.appengine.ext import testbed
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_urlfetch_stub()
+
+        self.urls = tokens.TOKENINFO_URL, tokens.CERTS_URL
+        tokens.TOKENINFO_URL = self.base + '/tokeninfo?%s=%s'
+        tokens.CERTS_URL = self.base + '/certs'
+        tokens._certs.update(keys=None, expires=0, fetched=0)
+        tokens._tokens = tokens._LRUCache(tokens.LRU_SIZE)
+
+        _Service.certs = (200, {'keys': [_jwk(self.key, 'k1')]} \
+            if self.key else {'keys': []})
+        _Service.accessTokens = {'good': {'user_id': '42',
+            'expires_in': 600}}
+        del _Service.requests[:]
+
+    def tearDown(self):
+        tokens.TOKENINFO_URL, tokens.CERTS_URL = self.urls
+        self.testbed.deactivate()
+
+    def _idToken(self, **claims):
+        values = {'iss': 'accounts.google.com', 'aud': tokens.AUDIENCES[0],
+            'sub': '7', 'exp': int(time.time()) + 600}
+        values.update(claims)
+        header = _b64encode(json.dumps(
+            {'alg': 'RS256', 'kid': 'k1'}).encode('utf-8'))
+        payload = _b64encode(json.dumps(values).encode('utf-8'))
+        signature = PKCS1_v1_5.new(self.key).sign(
+            SHA256.new('%s.%s' % (header, payload)))
+        return '%s.%s.%s' % (header, payload, _b64encode(signature))
+
+    def testAccessTokenIsCached(self):
+        self.assertEqual('42', tokens.getTokenUserId('good', 'access_token'))
+        self.assertEqual('42', tokens.getTokenUserId('good', 'access_token'))
+        self.assertEqual(['/tokeninfo'], _Service.requests)
+
+    def testRejectedTokenIsCachedBriefly(self):
+        self.assertEqual('', tokens.getTokenUserId('bad', 'access_token'))
+        tokens._tokens = tokens._LRUCache(tokens.LRU_SIZE)
+        self.assertEqual('', tokens.getTokenUserId('bad', 'access_token'))
+        self.assertEqual(['/tokeninfo'], _Service.requests)
+
+    def testUnreachableTokeninfoIsNotCached(self):
+        tokens.TOKENINFO_URL = 'http://127.0.0.1:1/tokeninfo?%s=%s'
+        self.assertEqual('', tokens.getTokenUserId('good', 'access_token'))
+        tokens.TOKENINFO_URL = self.base + '/tokeninfo?%s=%s'
+        self.assertEqual('42', tokens.getTokenUserId('good', 'access_token'))
+
+    @unittest.skipIf(RSA is None, 'pycrypto not installed')
+    def testIdTokenVerifiedLocally(self):
+        self.assertEqual('7', tokens.getTokenUserId(self._idToken()))
+        self.assertEqual('7', tokens.getTokenUserId(self._idToken()))
+        self.assertEqual(['/certs'], _Service.requests)
+
+    @unittest.skipIf(RSA is None, 'pycrypto not installed')
+    def testBadIdTokensNeverReachTokeninfo(self):
+        for token in (self._idToken(exp=int(time.time()) - 1),
+                self._idToken(aud='someone-else'),
+                self._idToken()[:-4] + 'AAAA'):
+            self.assertEqual('', tokens.getTokenUserId(token))
+        self.assertEqual(['/certs'], _Service.requests)
+
+    @unittest.skipIf(RSA is None, 'pycrypto not installed')
+    def testTokeninfoOnlyWithoutCerts(self):
+        _Service.certs = (500, {})
+        token = self._idToken()
+        _Service.accessTokens[token] = {'user_id': '7', 'expires_in': 600}
+        self.assertEqual('7', tokens.getTokenUserId(token))
+        self.assertEqual(['/certs', '/tokeninfo', '/tokeninfo'],
+            _Service.requests)
+
+    def testUnreachableCerts(self):
+        tokens.CERTS_URL = 'http://127.0.0.1:1/certs'
+        self.assertEqual(None, tokens._getCerts())
+
+        # Not retried on every request
+        self.assertEqual(None, tokens._getCerts())
+
+
+if __name__ == '__main__':
+    unittest.main()
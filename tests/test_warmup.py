@@ -0,0 +1,63 @@
+"""Tests for the warmup handler, on the local service stubs."""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import unittest
+
+from tests import sdkModule
+
+main = sdkModule('main')
+
+
+@unittest.skipIf(main is None, 'App Engine SDK not installed')
+class WarmupTest(unittest.TestCase):
+
+    def setUp(self):
+        import localstubs
+        import tokens
+
+        self.bed = localstubs.activate()
+        self.certsUrl = tokens.CERTS_URL
+        tokens.CERTS_URL = 'http://127.0.0.1:1/certs'
+
+    def tearDown(self):
+        import tokens
+
+        tokens.CERTS_URL = self.certsUrl
+        self.bed.deactivate()
+
+    def testFillsHotCaches(self):
+        import announcements
+        import confindex
+        import profiles
+        from google.appengine.api import memcache
+        from google.appengine.ext import ndb
+        from models import Conference
+        from models import Profile
+
+        organizers = ['ann@example.com', 'bob@example.com']
+        ndb.put_multi([Profile(key=ndb.Key(Profile, user_id),
+            displayName=user_id.split('@')[0]) for user_id in organizers])
+        ndb.put_multi([
+            Conference(parent=ndb.Key(Profile, organizers[0]),
+                name='Algebra', city='Paris', seatsAvailable=3),
+            Conference(parent=ndb.Key(Profile, organizers[1]),
+                name='Geometry', city='Tokyo', seatsAvailable=500),
+            ])
+        confindex._index.update(generation=None, entries=None,
+            postings=None, records=None)
+
+        response = main.app.get_response('/_ah/warmup')
+        self.assertEqual(200, response.status_int)
+
+        self.assertEqual(['Algebra', 'Geometry'],
+            sorted(name for name, wsk in confindex._index['entries']))
+        self.assertEqual(['Algebra'], list(memcache.get(
+            announcements.MEMCACHE_ANNOUNCEMENTS_KEY)['confs'].values()))
+        self.assertEqual(['ann', 'bob'],
+            [memcache.get(profiles.MEMCACHE_DISPLAY_NAME_KEY % user_id) \
+                for user_id in organizers])
+
+
+if __name__ == '__main__':
+    unittest.main()
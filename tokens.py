@@ -0,0 +1,250 @@
+"""tokens.py
+
+Verified OAuth token cache for utils.getUserId.
+
+Verified tokens are cached by token hash in an in-process LRU and in
+memcache, each entry living no longer than the token itself; rejected
+tokens are cached as such for REJECTED_TOKEN_CACHE_TIME. Google id
+tokens are verified locally against Google's cached signing keys, so
+the hot path makes no outbound calls. Only access tokens, and id tokens
+while the signing keys cannot be loaded, go to the tokeninfo service,
+once and without retries.
+
+"""
+
+__author__ = 'robertkohl125@gmail.com (Robert Kohl)'
+
+import base64
+import binascii
+import collections
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import urlfetch
+
+from settings import WEB_CLIENT_ID
+
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+AUDIENCES = (WEB_CLIENT_ID,)
+
+MEMCACHE_TOKEN_KEY = "TOKEN:%s"
+MEMCACHE_CERTS_KEY = "OAUTH_CERTS"
+MAX_TOKEN_CACHE_TIME = 3600
+REJECTED_TOKEN_CACHE_TIME = 60
+DEFAULT_CERTS_CACHE_TIME = 3600
+MIN_CERTS_REFRESH_TIME = 60
+LRU_SIZE = 1000
+
+
+class _LRUCache(object):
+    """Thread-safe in-process LRU of (value, expires) entries."""
+
+    def __init__(self, size):
+        self._size = size
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None or item[1] <= time.time():
+                return None
+            self._items[key] = item
+            return item[0]
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (value, expires)
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+
+_tokens = _LRUCache(LRU_SIZE)
+_certs = {'keys': None, 'expires': 0, 'fetched': 0}
+
+
+class CertsUnavailableError(Exception):
+    """Google's id token signing keys could not be loaded."""
+
+
+def _b64decode(data):
+    """Decode unpadded base64url data.
+    """
+
+    data = str(data)
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _getCerts(refresh=False):
+    """Return Google's id token signing keys as {kid: RSA key}, cached
+    in process and in memcache for as long as Google allows, or the last
+    keys loaded (None if none ever were) if they cannot be fetched.
+    """
+
+    now = time.time()
+    if not refresh and _certs['expires'] > now:
+        return _certs['keys']
+
+    jwks = None if refresh else memcache.get(MEMCACHE_CERTS_KEY)
+    max_age = DEFAULT_CERTS_CACHE_TIME
+    if jwks is None:
+        # Unknown key ids or a failing certs service must not turn into
+        # one outbound call per request
+        if _certs['fetched'] + MIN_CERTS_REFRESH_TIME > now:
+            return _certs['keys']
+        _certs['fetched'] = now
+        try:
+            resp = urlfetch.fetch(CERTS_URL)
+            if resp.status_code != 200:
+                return _certs['keys']
+            jwks = json.loads(resp.content)
+        except (urlfetch.Error, ValueError):
+            logging.warning('Could not fetch %s', CERTS_URL, exc_info=True)
+            return _certs['keys']
+        match = re.search(r'max-age=(\d+)',
+            resp.headers.get('Cache-Control', ''))
+        if match:
+            max_age = int(match.group(1))
+        memcache.set(MEMCACHE_CERTS_KEY, jwks, time=max_age)
+
+    # pycrypto is only loaded once keys are needed
+    from Crypto.PublicKey import RSA
+
+    keys = {}
+    for jwk in jwks.get('keys', []):
+        if jwk.get('kty') == 'RSA':
+            keys[jwk['kid']] = RSA.construct((
+                int(binascii.hexlify(_b64decode(jwk['n'])), 16),
+                int(binascii.hexlify(_b64decode(jwk['e'])), 16)))
+    _certs['keys'] = keys
+    _certs['expires'] = now + max_age
+    return keys
+
+
+def preloadCerts():
+    """Load Google's id token signing keys into the process, e.g. while
+    warming up an instance.
+    """
+
+    _getCerts()
+
+
+def verifyIdToken(token):
+    """Verify a Google id token locally. Returns its claims, or None if
+    the token is malformed, badly signed, expired or not meant for us.
+    Raises CertsUnavailableError if the signing keys cannot be loaded.
+    """
+
+    try:
+        header, payload, signature = token.split('.')
+        jwt_header = json.loads(_b64decode(header))
+        claims = json.loads(_b64decode(payload))
+        signature = _b64decode(signature)
+    except (ValueError, TypeError):
+        return None
+    if jwt_header.get('alg') != 'RS256':
+        return None
+
+    keys = _getCerts()
+    if keys is None:
+        raise CertsUnavailableError()
+
+    # Refresh the keys once if Google has rotated them
+    key = keys.get(jwt_header.get('kid'))
+    if key is None:
+        key = (_getCerts(refresh=True) or {}).get(jwt_header.get('kid'))
+    if key is None:
+        return None
+
+    from Crypto.Hash import SHA256
+    from Crypto.Signature import PKCS1_v1_5
+
+    digest = SHA256.new('%s.%s' % (header, payload))
+    if not PKCS1_v1_5.new(key).verify(digest, signature):
+        return None
+
+    if claims.get('iss') not in ISSUERS \
+            or claims.get('aud') not in AUDIENCES \
+            or int(claims.get('exp', 0)) <= time.time():
+        return None
+    return claims
+
+
+def _fetchTokenInfo(token, token_type):
+    """Return the tokeninfo service's data for a token, {} if it rejects
+    the token, or None if the service cannot be reached.
+    """
+
+    types = [token_type]
+    if token_type != 'access_token':
+        types.append('access_token')
+    for token_type in types:
+        try:
+            resp = urlfetch.fetch(TOKENINFO_URL % (token_type, token))
+        except urlfetch.Error:
+            logging.warning('Could not reach tokeninfo', exc_info=True)
+            return None
+        if resp.status_code == 200:
+            try:
+                return json.loads(resp.content)
+            except ValueError:
+                return None
+        # A token rejected as an id token is tried as an access token
+        if resp.status_code != 400 or 'invalid_token' not in resp.content:
+            return None
+    return {}
+
+
+def getTokenUserId(token, token_type='id_token'):
+    """Return the user id for a bearer token, or '' if it is invalid.
+    """
+
+    cache_key = MEMCACHE_TOKEN_KEY % hashlib.sha256(token).hexdigest()
+    user_id = _tokens.get(cache_key)
+    if user_id is not None:
+        return user_id
+    cached = memcache.get(cache_key)
+    if cached is not None:
+        user_id, expires = cached
+        _tokens.set(cache_key, user_id, expires)
+        return user_id
+
+    # Verify id tokens locally; tokeninfo only sees access tokens and
+    # id tokens while the signing keys are unavailable
+    user = None
+    if token_type == 'id_token' and token.count('.') == 2:
+        try:
+            claims = verifyIdToken(token)
+        except CertsUnavailableError:
+            pass
+        else:
+            user = {}
+            if claims:
+                user = {'user_id': claims['sub'],
+                    'expires_in': int(claims['exp']) - time.time()}
+    if user is None:
+        user = _fetchTokenInfo(token, token_type)
+        if user is None:
+            # Not known to be bad; do not remember it
+            return ''
+    user_id = user.get('user_id', '')
+
+    # Cache valid tokens no longer than they live, rejected ones briefly
+    if user_id:
+        ttl = min(int(float(user.get('expires_in', 0))),
+            MAX_TOKEN_CACHE_TIME)
+    else:
+        ttl = REJECTED_TOKEN_CACHE_TIME
+    if ttl > 0:
+        expires = time.time() + ttl
+        memcache.set(cache_key, (user_id, expires), time=ttl)
+        _tokens.set(cache_key, user_id, expires)
+    return user_id